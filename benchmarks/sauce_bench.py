@@ -0,0 +1,447 @@
+"""
+Offline load test for PictureSauce
+
+Replays a synthetic firehose of messages through `SauceHandler.on_message`
+against a local aiohttp server that imitates SauceNAO, with no Discord
+connection or API key needed. Reports throughput, per stage latency
+percentiles and memory use.
+
+Run from the repository root with the cog's requirements installed:
+
+    python -m benchmarks.sauce_bench --messages 2000 --guilds 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import discord
+from aiohttp import web
+from PIL import Image
+
+from picturesauce.cache import ResultCache
+from picturesauce.converters import Trigger
+from picturesauce.cooldowns import CooldownTracker
+from picturesauce.edits import ProcessedImages
+from picturesauce.extractor import ImageExtractor
+from picturesauce.metrics import Metrics
+from picturesauce.pipeline import SaucePipeline
+from picturesauce.prefixes import PrefixCache
+from picturesauce.reactions import PendingImages
+from picturesauce.ratelimit import QuotaScheduler
+from picturesauce.sauceapi import SauceNaoClient
+from picturesauce.saucehandler import SauceHandler
+from picturesauce.settings import SettingsCache
+from picturesauce.singleflight import SingleFlight
+from picturesauce.triggers import TriggerStore
+from picturesauce.workers import WorkerPool
+
+GUILD_DEFAULTS = {
+    "lookup_mode": "url",
+    "dbmask": None,
+    "dbmaski": None,
+    "numres": 6,
+    "min_similarity": 0.0,
+    "reaction_emoji": None,
+}
+
+
+class FakeSauceNao:
+    """
+    Local stand-in for the SauceNAO search API and an image host
+
+    Serves `/search.php` with configurable latency, 30 second and daily
+    quotas and a random error rate, and `/img/<n>.png` with small images
+    that differ per `n` so fingerprinting has real work to do.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        short_limit: int = 200,
+        long_limit: int = 100000,
+        error_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.short_limit = short_limit
+        self.long_limit = long_limit
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._short_window: List[float] = []
+        self._long_used = 0
+        self._images: Dict[int, bytes] = {}
+        self.runner: Optional[web.AppRunner] = None
+        self.port = 0
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/search.php", self.search)
+        app.router.add_get("/img/{number}.png", self.image)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    @property
+    def base_url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.port)
+
+    def _header(self, status: int = 0) -> Dict[str, Any]:
+        return {
+            "user_id": "1",
+            "account_type": "1",
+            "short_limit": str(self.short_limit),
+            "long_limit": str(self.long_limit),
+            "short_remaining": self.short_limit - len(self._short_window),
+            "long_remaining": self.long_limit - self._long_used,
+            "status": status,
+            "results_requested": 6,
+            "search_depth": "128",
+            "minimum_similarity": 50.0,
+            "results_returned": 1,
+            "message": "",
+        }
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        now = time.monotonic()
+        self._short_window = [t for t in self._short_window if now - t < 30]
+        if len(self._short_window) >= self.short_limit or self._long_used >= self.long_limit:
+            self.throttled += 1
+            header = self._header()
+            if self._long_used >= self.long_limit:
+                header["message"] = "Daily Search Limit Exceeded."
+            return web.json_response({"header": header}, status=429)
+        self._short_window.append(now)
+        self._long_used += 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=500)
+        url = request.query.get("url", "upload")
+        result = {
+            "header": {
+                "similarity": "{:.2f}".format(random.uniform(60, 99)),
+                "thumbnail": "{}/img/0.png".format(self.base_url),
+                "index_id": 5,
+                "index_name": "Index #5: Pixiv Images",
+            },
+            "data": {
+                "ext_urls": ["https://www.pixiv.net/artworks/{}".format(abs(hash(url)) % 10 ** 8)],
+                "title": "Bench image",
+                "member_name": "bench",
+            },
+        }
+        return web.json_response({"header": self._header(), "results": [result]})
+
+    async def image(self, request: web.Request) -> web.Response:
+        number = int(request.match_info["number"])
+        data = self._images.get(number)
+        if data is None:
+            rng = random.Random(number)
+            image = Image.new("L", (64, 64))
+            image.putdata([rng.randrange(256) for _ in range(64 * 64)])
+            out = BytesIO()
+            image.resize((256, 256)).save(out, "PNG")
+            data = self._images[number] = out.getvalue()
+        return web.Response(body=data, content_type="image/png")
+
+
+class FakeConfigGroup:
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+
+    async def all(self) -> Dict[str, Any]:
+        return dict(self._data)
+
+
+class FakeConfig:
+    def __init__(self):
+        self.guilds: Dict[int, Dict[str, Any]] = {}
+
+    def guild(self, guild) -> FakeConfigGroup:
+        return FakeConfigGroup(self.guilds.setdefault(guild.id, dict(GUILD_DEFAULTS)))
+
+
+class FakePermissions:
+    send_messages = True
+    embed_links = True
+
+
+class FakeMember:
+    bot = False
+
+    def __init__(self, member_id: int, guild: "FakeGuild"):
+        self.id = member_id
+        self.guild = guild
+
+
+class FakeState:
+    """Stands in for the connection state used by discord.py 1.x raw sends"""
+
+    def __init__(self, channel: "FakeChannel"):
+        self.channel = channel
+        self.http = self
+
+    async def request(self, route, json=None):
+        await self.channel.send(embeds=json["embeds"])
+        return {}
+
+    def create_message(self, channel, data):
+        return None
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild: "FakeGuild", send_latency: float):
+        self.id = channel_id
+        self.category_id = None
+        self.guild = guild
+        self.mention = "<#{}>".format(channel_id)
+        self.send_latency = send_latency
+        self.sent = 0
+        self.embeds = 0
+        self.typing = 0
+        self._state = FakeState(self)
+
+    def permissions_for(self, member) -> FakePermissions:
+        return FakePermissions()
+
+    async def trigger_typing(self) -> None:
+        self.typing += 1
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.send_latency)
+        self.sent += 1
+        self.embeds += len(kwargs.get("embeds") or [kwargs.get("embed")])
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, send_latency: float):
+        self.id = guild_id
+        self.me = FakeMember(0, self)
+        self.owner = None
+        self.channel = FakeChannel(guild_id * 10, self, send_latency)
+
+    def get_member(self, member_id: int) -> FakeMember:
+        return FakeMember(member_id, self)
+
+
+class FakeAttachment:
+    content_type = "image/png"
+    width = 256
+    height = 256
+
+    def __init__(self, url: str):
+        self.url = url
+        self.size = 70000
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, guild: FakeGuild, content: str, attachments: List[FakeAttachment]):
+        self.id = message_id
+        self.guild = guild
+        self.channel = guild.channel
+        self.author = FakeMember(random.randrange(1, 10 ** 6), guild)
+        self.content = content
+        self.attachments = attachments
+        self.embeds: List[discord.Embed] = []
+        self.reference = None
+
+    def to_message_reference_dict(self) -> Dict[str, int]:
+        return {"message_id": self.id, "channel_id": self.channel.id}
+
+
+class FakeBot:
+    def __init__(self):
+        self.all_commands = {"help": object(), "sauce": object()}
+        self.loop = asyncio.get_event_loop()
+
+    async def command_prefix(self, bot, message) -> List[str]:
+        return ["!", "?"]
+
+    def get_command(self, name: str):
+        return self.all_commands.get(name)
+
+    async def allowed_by_whitelist_blacklist(self, who) -> bool:
+        return True
+
+    async def get_embed_colour(self, channel) -> discord.Colour:
+        return discord.Colour(0xE74C3C)
+
+    async def get_shared_api_tokens(self, service: str) -> Dict[str, str]:
+        return {"api_key": "bench"}
+
+
+class BenchSauce(SauceHandler):
+    """SauceHandler wired up the way `PictureSauce.__init__` does, minus Red"""
+
+    def __init__(self, bot: FakeBot, data_path: Path, server: FakeSauceNao, args: argparse.Namespace):
+        self.bot = bot
+        self.config = FakeConfig()
+        self.workers = WorkerPool(args.workers)
+        self.sauce_api = SauceNaoClient()
+        self.sauce_api.SAUCENAO_URL = server.base_url + "/search.php"
+        self.sauce_cache = ResultCache(data_path / "sauce_cache.db")
+        self.sauce_quota = QuotaScheduler(
+            short_limit=server.short_limit,
+            long_limit=server.long_limit,
+            max_queue=args.guild_queue,
+            max_wait=args.max_wait,
+        )
+        self.lookup_semaphore = asyncio.Semaphore(args.concurrency)
+        self.extractor = ImageExtractor()
+        self.prefix_cache = PrefixCache(bot)
+        self.settings = SettingsCache(bot, self.config)
+        self.pipeline = SaucePipeline(
+            self.process_job, workers=args.pipeline_workers, maxsize=args.queue_size
+        )
+        self.inflight = SingleFlight()
+        self.cooldowns = CooldownTracker()
+        self.processed = ProcessedImages()
+        self.pending = PendingImages()
+        self.metrics = Metrics()
+        self.triggers = TriggerStore(on_hydrate=self.reindex_triggers)
+        self.trigger_index = {}
+        self.trigger_timeout = 1
+        self.image_max_size = 8 * 1024 * 1024
+        self.upload_max_size = 32 * 1024 * 1024
+
+    async def close(self) -> None:
+        await self.pipeline.drain(timeout=60)
+        self.inflight.cancel_all()
+        self.sauce_quota.close()
+        await self.sauce_api.close()
+        await self.sauce_cache.close()
+        self.workers.shutdown()
+
+
+def build_messages(args: argparse.Namespace, guilds: List[FakeGuild], base_url: str) -> List[FakeMessage]:
+    image_numbers = max(1, int(args.messages * args.images * args.unique))
+    messages = []
+    for message_id in range(1, args.messages + 1):
+        guild = random.choice(guilds)
+        roll = random.random()
+        if roll < args.command_rate:
+            messages.append(FakeMessage(message_id, guild, "!help sauce", []))
+            continue
+        if roll < args.command_rate + args.text_rate:
+            messages.append(FakeMessage(message_id, guild, "just chatting", []))
+            continue
+        urls = [
+            "{}/img/{}.png".format(base_url, random.randrange(image_numbers))
+            for _ in range(args.images)
+        ]
+        attachments = [FakeAttachment(url) for url in urls[: args.images // 2 + 1]]
+        content = " ".join(urls[len(attachments):])
+        messages.append(FakeMessage(message_id, guild, content, attachments))
+    return messages
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    random.seed(args.seed)
+    server = FakeSauceNao(
+        latency=args.latency,
+        jitter=args.latency / 3,
+        short_limit=args.short_limit,
+        long_limit=args.long_limit,
+        error_rate=args.error_rate,
+    )
+    await server.start()
+    bot = FakeBot()
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        cog = BenchSauce(bot, Path(tmp), server, args)
+        await cog.sauce_cache.initialize()
+        cog.pipeline.start()
+        guilds = [FakeGuild(guild_id, args.send_latency) for guild_id in range(1, args.guilds + 1)]
+        for guild in guilds:
+            cog.triggers[guild.id] = [Trigger(0, setlist=[guild.channel.id], created_at=guild.id)]
+            cog.reindex_triggers(guild.id)
+        messages = build_messages(args, guilds, server.base_url)
+
+        start = time.perf_counter()
+        dispatch = 0.0
+        interval = 1 / args.rate if args.rate else 0
+        for message in messages:
+            before = time.perf_counter()
+            await cog.on_message(message)
+            dispatch += time.perf_counter() - before
+            if interval:
+                await asyncio.sleep(interval)
+        submitted = time.perf_counter() - start
+        await cog.close()
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    await server.stop()
+    return {
+        "messages": len(messages),
+        "dispatch_seconds": round(dispatch, 4),
+        "on_message_per_second": round(len(messages) / dispatch, 1) if dispatch else None,
+        "submit_seconds": round(submitted, 3),
+        "total_seconds": round(elapsed, 3),
+        "messages_per_second": round(len(messages) / elapsed, 1),
+        "replies_sent": sum(g.channel.sent for g in guilds),
+        "embeds_sent": sum(g.channel.embeds for g in guilds),
+        "api_requests": server.requests,
+        "api_throttled": server.throttled,
+        "api_errors": server.errors,
+        "counters": dict(cog.metrics.counters),
+        "dropped_jobs": cog.pipeline.dropped,
+        "stages_ms": {
+            row[0]: {"count": row[1], "p50": round(row[2], 3), "p95": round(row[3], 3), "p99": round(row[4], 3)}
+            for row in cog.metrics.stage_rows()
+        },
+        "python_peak_mb": round(peak / 2 ** 20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=1000, help="messages to replay")
+    parser.add_argument("--guilds", type=int, default=20, help="guilds the messages are spread over")
+    parser.add_argument("--images", type=int, default=2, help="images per image message")
+    parser.add_argument("--unique", type=float, default=0.5, help="fraction of distinct images")
+    parser.add_argument("--command-rate", type=float, default=0.1, help="fraction of command messages")
+    parser.add_argument("--text-rate", type=float, default=0.3, help="fraction of messages without images")
+    parser.add_argument("--rate", type=float, default=0, help="messages per second, 0 replays as fast as possible")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean fake SauceNAO latency in seconds")
+    parser.add_argument("--send-latency", type=float, default=0.01, help="fake channel.send latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls that fail")
+    parser.add_argument("--short-limit", type=int, default=200, help="fake 30 second quota")
+    parser.add_argument("--long-limit", type=int, default=100000, help="fake daily quota")
+    parser.add_argument("--concurrency", type=int, default=4, help="global lookup concurrency")
+    parser.add_argument("--pipeline-workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=100)
+    parser.add_argument("--guild-queue", type=int, default=10, help="quota scheduler queue per guild")
+    parser.add_argument("--max-wait", type=float, default=60.0, help="longest wait for quota")
+    parser.add_argument("--workers", type=int, default=2, help="image worker pool size")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
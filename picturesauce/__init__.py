@@ -1,12 +1,20 @@
 import json
+import time
 from pathlib import Path
 
-from .picturesauce import PictureSauce
+_import_started = time.perf_counter()
+from .picturesauce import PictureSauce  # noqa: E402
+
+IMPORT_TIME = time.perf_counter() - _import_started
 
 with open(Path(__file__).parent / "info.json") as fp:
     __red_end_user_data_statement__ = json.load(fp)["end_user_data_statement"]
 
 
 async def setup(bot):
+    started = time.perf_counter()
     cog = PictureSauce(bot)
-    bot.add_cog(cog)
+    cog.metrics.startup["import"] = IMPORT_TIME
+    cog.metrics.startup["init"] = time.perf_counter() - started
+    with cog.metrics.time_startup("register"):
+        bot.add_cog(cog)
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from .imaging import BKTree
+
+if TYPE_CHECKING:
+    from saucenao_api.containers import SauceResponse
+
+log = logging.getLogger("red.xangel-cogs.PictureSauce")
+
+
+class ResultCache:
+    """
+    Two tier cache of SauceNAO responses
+
+    An in-memory LRU sits in front of a sqlite store in the cog's data path
+    so lookups survive reloads and restarts. Responses without results are
+    cached as well so known misses don't spend API quota either.
+    Returns `None` on a miss, otherwise the cached `SauceResponse`.
+
+    Results can also be stored under an image fingerprint so reposts of the
+    same image under a different URL are found by hamming distance.
+    """
+
+    PRUNE_EVERY = 100
+    FINGERPRINT_PREFIX = "dhash:"
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        ttl: int = 604800,
+        max_entries: int = 50000,
+        memory_entries: int = 1024,
+        max_distance: int = 4,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.max_distance = max_distance
+        self._fingerprints = BKTree()
+        # fingerprints stored while the tree is being rebuilt off the loop
+        self._added: Optional[List[int]] = None
+        self._memory: "OrderedDict[str, Tuple[float, SauceResponse]]" = OrderedDict()
+        # sqlite connections aren't thread safe, keep all disk work on one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="picturesauce-cache")
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        # rows deleted on read since the tree was last rebuilt
+        self._expired = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> None:
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, raw TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)"
+        )
+        self._db.commit()
+
+    async def initialize(self) -> None:
+        await self._run(self._open)
+        await self.prune(rebuild=True)
+
+    def _build_fingerprints(self) -> BKTree:
+        tree = BKTree()
+        if self._db is None:
+            return tree
+        rows = self._db.execute(
+            "SELECT key FROM results WHERE key LIKE ?", (self.FINGERPRINT_PREFIX + "%",)
+        ).fetchall()
+        for (key,) in rows:
+            tree.add(int(key[len(self.FINGERPRINT_PREFIX):].split("|")[0], 16))
+        return tree
+
+    def _get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT stored_at, raw FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[0] > self.ttl:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._db.commit()
+            self._expired += 1
+            return None
+        self._db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        return row
+
+    def _set(self, key: str, raw: str, now: float) -> None:
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO results (key, raw, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, raw, now, now),
+        )
+        self._db.commit()
+
+    def _prune(self, now: float) -> int:
+        """Delete expired and excess rows, returns how many were removed"""
+        if self._db is None:
+            return 0
+        before = self._db.total_changes
+        self._db.execute("DELETE FROM results WHERE stored_at < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._db.commit()
+        return self._db.total_changes - before
+
+    def _clear(self) -> None:
+        if self._db is None:
+            return
+        self._db.execute("DELETE FROM results")
+        self._db.commit()
+
+    def _remember(self, key: str, stored_at: float, response: "SauceResponse") -> None:
+        self._memory[key] = (stored_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional["SauceResponse"]:
+        now = time.time()
+        cached = self._memory.get(key)
+        if cached is not None:
+            if now - cached[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                return cached[1]
+            del self._memory[key]
+        try:
+            row = await self._run(self._get, key, now)
+        except sqlite3.Error:
+            log.exception("Error reading the sauce cache")
+            return None
+        if row is None:
+            return None
+        from saucenao_api.containers import SauceResponse
+
+        response = SauceResponse(json.loads(row[1]))
+        self._remember(key, row[0], response)
+        return response
+
+    async def set(self, key: str, response: "SauceResponse") -> None:
+        now = time.time()
+        self._remember(key, now, response)
+        try:
+            await self._run(self._set, key, json.dumps(response.raw), now)
+        except sqlite3.Error:
+            log.exception("Error writing the sauce cache")
+            return
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            await self.prune()
+
+    def fingerprint_key(self, fingerprint: int, suffix: str = "") -> str:
+        return "{}{:016x}{}".format(self.FINGERPRINT_PREFIX, fingerprint, suffix)
+
+    async def get_similar(self, fingerprint: int, suffix: str = "") -> Optional["SauceResponse"]:
+        """Find a cached result for the closest stored fingerprint"""
+        for distance, match in self._fingerprints.find(fingerprint, self.max_distance):
+            response = await self.get(self.fingerprint_key(match, suffix))
+            if response is not None:
+                return response
+        return None
+
+    async def set_fingerprint(
+        self, fingerprint: int, response: "SauceResponse", suffix: str = ""
+    ) -> None:
+        self._fingerprints.add(fingerprint)
+        if self._added is not None:
+            self._added.append(fingerprint)
+        await self.set(self.fingerprint_key(fingerprint, suffix), response)
+
+    async def prune(self, rebuild: bool = False) -> None:
+        """
+        Drop expired and excess entries
+
+        The fingerprint tree can't delete entries so it is rebuilt from
+        the remaining rows whenever any were removed.
+        """
+        now = time.time()
+        for key in [k for k, (stored_at, _) in self._memory.items() if now - stored_at > self.ttl]:
+            del self._memory[key]
+        try:
+            removed = await self._run(self._prune, now)
+            if not (removed or self._expired or rebuild):
+                return
+            self._expired = 0
+            self._added = []
+            tree = await self._run(self._build_fingerprints)
+        except sqlite3.Error:
+            log.exception("Error pruning the sauce cache")
+            self._added = None
+            return
+        for fingerprint in self._added:
+            tree.add(fingerprint)
+        self._fingerprints = tree
+        self._added = None
+
+    async def clear(self) -> None:
+        self._memory.clear()
+        self._fingerprints = BKTree()
+        await self._run(self._clear)
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    async def close(self) -> None:
+        def _close():
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+        await self._run(_close)
+        self._executor.shutdown(wait=False)
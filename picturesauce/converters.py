@@ -1,6 +1,7 @@
 import asyncio
+import functools
 import logging
-from typing import List, Pattern, Tuple, Union, Optional, Literal
+from typing import Dict, List, Pattern, Tuple, Union, Optional, Literal
 
 import discord
 from discord.ext.commands.converter import Converter, IDConverter, RoleConverter
@@ -110,19 +111,28 @@ class Trigger:
     Trigger class to handle trigger objects
     """
 
+    __slots__ = ("author", "enabled", "count", "setlist", "cooldown", "created_at", "delete_after")
+
     author: int
+    enabled: bool
     count: int
-    setlist: list
+    setlist: frozenset
     cooldown: dict
-    created: int
+    created_at: int
+    delete_after: Optional[int]
 
     def __init__(self, author, **kwargs):
         self.author = author
         self.enabled = kwargs.get("enabled", True)
         self.count = kwargs.get("count", 0)
-        self.setlist = kwargs.get("setlist", [])
+        self.setlist = frozenset(kwargs.get("setlist", ()))
         self.cooldown = kwargs.get("cooldown", {})
         self.created_at = kwargs.get("created_at", 0)
+        self.delete_after = kwargs.get("delete_after", None)
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Trigger":
+        return cls(**data)
 
     def enable(self):
         """Explicitly enable this trigger"""
@@ -137,7 +147,7 @@ class Trigger:
         self.enabled = not self.enabled
 
     def __repr__(self):
-        return "<ReTrigger name={0.name} author={0.author} response={0.response_type} pattern={0.regex.pattern}>".format(
+        return "<Trigger created_at={0.created_at} author={0.author} enabled={0.enabled} count={0.count}>".format(
             self
         )
 
@@ -155,14 +165,15 @@ class Trigger:
         )
         return info
 
-    async def to_json(self) -> dict:
+    def to_json(self) -> dict:
         return {
             "author": self.author,
             "enabled": self.enabled,
             "count": self.count,
-            "setlist": self.setlist,
+            "setlist": list(self.setlist),
             "cooldown": self.cooldown,
-            "created_at": self.created_at
+            "created_at": self.created_at,
+            "delete_after": self.delete_after,
         }
 
 
@@ -180,6 +191,36 @@ class Trigger:
 #         return result
 
 
+@functools.lru_cache(maxsize=None)
+def sauce_indexes() -> Dict[str, int]:
+    """SauceNAO index names mapped to their numbers"""
+    from saucenao_api.params import DB
+
+    return {
+        name.lower(): value
+        for name, value in vars(DB).items()
+        if isinstance(value, int) and not name.startswith("_") and value != DB.ALL
+    }
+
+
+class SauceIndex(Converter):
+    """
+    This will convert a SauceNAO index name or number into its index number
+    """
+
+    async def convert(self, ctx: commands.Context, argument: str) -> int:
+        indexes = sauce_indexes()
+        name = argument.lower().replace("-", "_")
+        if name in indexes:
+            return indexes[name]
+        matches = [v for k, v in indexes.items() if k.startswith(name)]
+        if len(matches) == 1:
+            return matches[0]
+        if argument.isdigit() and int(argument) in indexes.values():
+            return int(argument)
+        raise BadArgument(_("`{arg}` is not a SauceNAO index.").format(arg=argument))
+
+
 class ValidRegex(Converter):
     """
     This will check to see if the provided regex pattern is valid
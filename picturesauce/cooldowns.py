@@ -0,0 +1,79 @@
+import heapq
+import time
+from typing import Dict, List, Literal, Optional, Tuple
+
+import discord
+
+from .converters import Trigger
+
+CooldownScope = Literal["user", "channel", "guild"]
+COOLDOWN_SCOPES: Tuple[CooldownScope, ...] = ("user", "channel", "guild")
+
+_Key = Tuple[int, str, int]
+
+
+class CooldownTracker:
+    """
+    Enforces the per user, channel and guild windows in `Trigger.cooldown`
+
+    `Trigger.cooldown` maps a scope to its window in seconds. Expiry times
+    use the monotonic clock and sit in a heap so expired entries are pruned
+    in order as time passes, keeping memory proportional to the users who
+    are actually on cooldown. `max_entries` caps it during floods.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._expires: Dict[_Key, float] = {}
+        self._heap: List[Tuple[float, _Key]] = []
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def _prune(self, now: float) -> None:
+        heap = self._heap
+        while heap and (heap[0][0] <= now or len(heap) > self.max_entries):
+            expiry, key = heapq.heappop(heap)
+            if self._expires.get(key) == expiry:
+                del self._expires[key]
+
+    def _targets(self, message: discord.Message, user: Optional[discord.abc.User]) -> Dict[str, int]:
+        return {
+            "user": (user or message.author).id,
+            "channel": message.channel.id,
+            "guild": message.guild.id if message.guild else 0,
+        }
+
+    def check(
+        self, trigger: Trigger, message: discord.Message, user: Optional[discord.abc.User] = None
+    ) -> bool:
+        """
+        Returns True and starts the cooldowns if the trigger may run for this message
+
+        `user` replaces the message author for the user scope, e.g. whoever
+        reacted to ask for a lookup.
+        """
+        if not trigger.cooldown:
+            return True
+        now = time.monotonic()
+        self._prune(now)
+        targets = self._targets(message, user)
+        keys = []
+        for scope in COOLDOWN_SCOPES:
+            seconds = trigger.cooldown.get(scope)
+            if not seconds:
+                continue
+            key = (trigger.created_at, scope, targets[scope])
+            if self._expires.get(key, 0) > now:
+                return False
+            keys.append((key, now + seconds))
+        for key, expiry in keys:
+            self._expires[key] = expiry
+            heapq.heappush(self._heap, (expiry, key))
+        return True
+
+    def reset(self, trigger: Trigger) -> None:
+        """Forget the running cooldowns of a trigger after its windows change"""
+        self._expires = {k: v for k, v in self._expires.items() if k[0] != trigger.created_at}
+        self._heap = [(v, k) for k, v in self._expires.items()]
+        heapq.heapify(self._heap)
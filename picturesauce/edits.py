@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from typing import FrozenSet, List, Tuple
+
+from .extractor import ImageCandidate
+
+
+class ProcessedImages:
+    """
+    Remembers which images were already handled for recent messages
+
+    Lets an edit look up only the images it adds instead of the whole
+    message again. Entries expire `max_age` seconds after the message was
+    first seen and the oldest are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 5000, max_age: float = 3600.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._messages: "OrderedDict[int, Tuple[float, FrozenSet[str]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __contains__(self, message_id: object) -> bool:
+        self._prune(time.monotonic())
+        return message_id in self._messages
+
+    def _prune(self, now: float) -> None:
+        messages = self._messages
+        cutoff = now - self.max_age
+        while messages and next(iter(messages.values()))[0] <= cutoff:
+            messages.popitem(last=False)
+        while len(messages) > self.max_entries:
+            messages.popitem(last=False)
+
+    def record(self, message_id: int, images: List[ImageCandidate]) -> None:
+        """Remember the images found when a message was first processed"""
+        now = time.monotonic()
+        self._messages[message_id] = (now, frozenset(i.key for i in images))
+        self._prune(now)
+
+    def added(self, message_id: int, images: List[ImageCandidate]) -> List[ImageCandidate]:
+        """Return the images not seen before for this message and remember them"""
+        now = time.monotonic()
+        stored_at, seen = self._messages.get(message_id, (now, frozenset()))
+        new = [i for i in images if i.key not in seen]
+        if new:
+            # keep the original timestamp so edits don't extend the entry's life
+            self._messages[message_id] = (stored_at, seen | {i.key for i in new})
+        return new
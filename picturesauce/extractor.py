@@ -0,0 +1,150 @@
+import re
+from typing import Iterable, List, NamedTuple, Optional, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import discord
+
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "webp")
+IMAGE_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp")
+DISCORD_CDN_HOSTS = ("cdn.discordapp.com", "media.discordapp.net")
+# query parameters Discord adds to sign or resize attachment links
+DISCORD_VOLATILE_PARAMS = frozenset({"ex", "is", "hm", "width", "height", "format", "quality"})
+
+URL_RE = re.compile(r"<?(https?://[^\s<>|]+)>?", re.IGNORECASE)
+IMAGE_PATH_RE = re.compile(r"\.(?:jpe?g|png|webp)$", re.IGNORECASE)
+IMAGE_FORMAT_RE = re.compile(r"(?:^|&)format=(?:jpe?g|png|webp)(?:&|$)", re.IGNORECASE)
+TRAILING_PUNCTUATION = ".,;:!?)]}'\"*_~"
+
+
+class ImageCandidate(NamedTuple):
+    """An image found in a message that can be looked up"""
+
+    url: str
+    key: str
+    source: str
+    size: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def normalize_url(url: str) -> str:
+    """
+    Build a stable key for an image URL
+
+    Hosts are lowercased, fragments dropped, and Discord CDN links lose the
+    signing and resize parameters that change between uploads and views.
+    """
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    query = parts.query
+    if host in DISCORD_CDN_HOSTS:
+        host = DISCORD_CDN_HOSTS[0]
+        query = urlencode(
+            [(k, v) for k, v in parse_qsl(query) if k not in DISCORD_VOLATILE_PARAMS]
+        )
+    return urlunsplit((parts.scheme.lower(), host, parts.path, query, ""))
+
+
+def _is_image_url(url: str) -> bool:
+    parts = urlsplit(url)
+    return bool(IMAGE_PATH_RE.search(parts.path) or IMAGE_FORMAT_RE.search(parts.query))
+
+
+class ImageExtractor:
+    """
+    Collects every lookup-worthy image in a message in a single pass
+
+    Attachments, embed images, links in the content and the same sources
+    on the replied-to message are checked. Results are deduplicated by
+    their normalized URL and keep the order they appear in.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int = 20 * 1024 * 1024,
+        min_dimension: int = 32,
+        max_images: int = 10,
+        include_replies: bool = True,
+    ):
+        self.max_size = max_size
+        self.min_dimension = min_dimension
+        self.max_images = max_images
+        self.include_replies = include_replies
+
+    def extract(self, message: discord.Message) -> List[ImageCandidate]:
+        seen: Set[str] = set()
+        found: List[ImageCandidate] = []
+        self._collect(message, "", seen, found)
+        reference = getattr(message, "reference", None)
+        if self.include_replies and reference is not None:
+            resolved = getattr(reference, "resolved", None)
+            if isinstance(resolved, discord.Message):
+                self._collect(resolved, "reply_", seen, found)
+        return found[: self.max_images]
+
+    def _collect(
+        self, message: discord.Message, prefix: str, seen: Set[str], found: List[ImageCandidate]
+    ) -> None:
+        for candidate in self._from_attachments(message.attachments, prefix):
+            self._add(candidate, seen, found)
+        for candidate in self._from_content(message.content, prefix):
+            self._add(candidate, seen, found)
+        for candidate in self._from_embeds(message.embeds, prefix):
+            self._add(candidate, seen, found)
+
+    def _add(self, candidate: ImageCandidate, seen: Set[str], found: List[ImageCandidate]) -> None:
+        if candidate.key in seen:
+            return
+        seen.add(candidate.key)
+        found.append(candidate)
+
+    def _from_attachments(
+        self, attachments: Iterable[discord.Attachment], prefix: str
+    ) -> Iterable[ImageCandidate]:
+        for attachment in attachments:
+            content_type = getattr(attachment, "content_type", None)
+            if content_type:
+                if content_type.split(";")[0].strip().lower() not in IMAGE_CONTENT_TYPES:
+                    continue
+            elif not _is_image_url(attachment.url):
+                continue
+            if attachment.size and attachment.size > self.max_size:
+                continue
+            width, height = attachment.width, attachment.height
+            if width is not None and height is not None:
+                if min(width, height) < self.min_dimension:
+                    continue
+            yield ImageCandidate(
+                attachment.url,
+                normalize_url(attachment.url),
+                prefix + "attachment",
+                attachment.size,
+                width,
+                height,
+            )
+
+    def _from_content(self, content: str, prefix: str) -> Iterable[ImageCandidate]:
+        if not content or "http" not in content:
+            return
+        for match in URL_RE.finditer(content):
+            url = match.group(1).rstrip(TRAILING_PUNCTUATION)
+            if _is_image_url(url):
+                yield ImageCandidate(url, normalize_url(url), prefix + "content")
+
+    def _from_embeds(self, embeds: Iterable[discord.Embed], prefix: str) -> Iterable[ImageCandidate]:
+        for embed in embeds:
+            if embed.type == "image":
+                url = embed.thumbnail.url or embed.url
+            elif embed.type == "rich" or embed.type == "article":
+                url = embed.image.url
+            else:
+                continue
+            if not url:
+                continue
+            url = str(url)
+            width = getattr(embed.image, "width", None) or getattr(embed.thumbnail, "width", None)
+            height = getattr(embed.image, "height", None) or getattr(embed.thumbnail, "height", None)
+            if width and height and min(width, height) < self.min_dimension:
+                continue
+            yield ImageCandidate(url, normalize_url(url), prefix + "embed", None, width, height)
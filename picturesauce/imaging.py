@@ -0,0 +1,109 @@
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def dhash(data: bytes, size: int = 8) -> int:
+    """
+    Compute the difference hash of an image
+
+    The image is shrunk to `size + 1` x `size` greyscale pixels and each bit
+    records whether a pixel is brighter than its right neighbour.
+    This is CPU bound and should be run in an executor.
+    """
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as image:
+        image.draft("L", (size * 8, size * 8))
+        pixels = list(image.convert("L").resize((size + 1, size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def thumbnail(data: bytes, max_dimension: int = 512, quality: int = 85) -> bytes:
+    """
+    Downscale an image to a small JPEG suitable for uploading to SauceNAO
+
+    This is CPU bound and should be run in an executor.
+    """
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as image:
+        image.draft("RGB", (max_dimension, max_dimension))
+        image = image.convert("RGB")
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        out = BytesIO()
+        image.save(out, "JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def prepare_image(data: bytes, make_thumbnail: bool = False) -> Tuple[int, Optional[bytes]]:
+    """Hash an image and optionally build its upload thumbnail in one executor hop"""
+    return dhash(data), thumbnail(data) if make_thumbnail else None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over image hashes using hamming distance
+
+    Allows finding every stored hash within a small distance of a query
+    without comparing against the whole set.
+    """
+
+    def __init__(self):
+        self._root: Optional[Tuple[int, Dict[int, tuple]]] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int) -> None:
+        if self._root is None:
+            self._root = (value, {})
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (value, {})
+                self._size += 1
+                return
+            node = child
+
+    def find(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """Return `(distance, hash)` pairs within `max_distance` closest first"""
+        found: List[Tuple[int, int]] = []
+        if self._root is None:
+            return found
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0]))
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in node[1].items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        found.sort()
+        return found
+
+    def __iter__(self) -> Iterator[int]:
+        if self._root is None:
+            return
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            yield node[0]
+            stack.extend(node[1].values())
@@ -0,0 +1,147 @@
+import bisect
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# bucket upper bounds in seconds, roughly 1.5x apart from 0.1ms to 60s
+BUCKETS: Tuple[float, ...] = tuple(0.0001 * 1.5 ** i for i in range(34))
+
+
+class LatencyHistogram:
+    """
+    Fixed bucket latency histogram
+
+    Uses constant memory no matter how many samples it sees, percentiles
+    are interpolated inside the matching bucket.
+    """
+
+    __slots__ = ("counts", "total", "count", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= target and bucket_count:
+                low = BUCKETS[index - 1] if index else 0.0
+                high = BUCKETS[index] if index < len(BUCKETS) else self.maximum
+                return min(low + (high - low) * (target - seen) / bucket_count, self.maximum)
+            seen += bucket_count
+        return self.maximum
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Metrics:
+    """
+    Per stage latencies, event counters and gauges for the lookup pipeline
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self.counters: Counter = Counter()
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        # one off load costs in seconds, kept across resets
+        self.startup: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        try:
+            histogram = self.stages[stage]
+        except KeyError:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    @contextmanager
+    def time_startup(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup[stage] = self.startup.get(stage, 0.0) + time.perf_counter() - start
+
+    def incr(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] += amount
+
+    def gauge(self, name: str, func: Callable[[], float]) -> None:
+        self.gauges[name] = func
+
+    def reset(self) -> None:
+        self.started = time.time()
+        self.stages.clear()
+        self.counters.clear()
+
+    def stage_rows(self) -> List[Tuple[str, int, float, float, float, float]]:
+        """`(stage, count, p50, p95, p99, max)` rows with times in milliseconds"""
+        rows = []
+        for stage, hist in sorted(self.stages.items()):
+            rows.append(
+                (
+                    stage,
+                    hist.count,
+                    hist.percentile(0.50) * 1000,
+                    hist.percentile(0.95) * 1000,
+                    hist.percentile(0.99) * 1000,
+                    hist.maximum * 1000,
+                )
+            )
+        return rows
+
+    def prometheus(self, prefix: str = "picturesauce") -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        name = "{}_stage_seconds".format(prefix)
+        lines.append("# TYPE {} histogram".format(name))
+        for stage, hist in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, hist.counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{{stage="{}",le="{:.6g}"}} {}'.format(name, stage, bound, cumulative))
+            lines.append('{}_bucket{{stage="{}",le="+Inf"}} {}'.format(name, stage, hist.count))
+            lines.append('{}_sum{{stage="{}"}} {:.6f}'.format(name, stage, hist.total))
+            lines.append('{}_count{{stage="{}"}} {}'.format(name, stage, hist.count))
+        for counter, value in sorted(self.counters.items()):
+            lines.append("# TYPE {}_{}_total counter".format(prefix, counter))
+            lines.append("{}_{}_total {}".format(prefix, counter, value))
+        if self.startup:
+            lines.append("# TYPE {}_startup_seconds gauge".format(prefix))
+            for stage, seconds in self.startup.items():
+                lines.append('{}_startup_seconds{{stage="{}"}} {:.6f}'.format(prefix, stage, seconds))
+        for gauge, func in sorted(self.gauges.items()):
+            lines.append("# TYPE {}_{} gauge".format(prefix, gauge))
+            lines.append("{}_{} {}".format(prefix, gauge, func()))
+        return "\n".join(lines) + "\n"
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """Replace a file's contents without readers seeing a partial write"""
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
@@ -1,32 +1,55 @@
 import asyncio
 import logging
-from multiprocessing.pool import Pool
+import sys
+import time
 from pathlib import Path
-from typing import Optional, Union
+from typing import Dict, Optional, Union
 
 import discord
 from discord.ext import tasks
+from discord.ext.commands import BadArgument
 from redbot.core import Config, VersionInfo, checks, commands, modlog, version_info
 from redbot.core.commands import TimedeltaConverter
+from redbot.core.data_manager import cog_data_path
 from redbot.core.i18n import Translator, cog_i18n
 
 # from redbot.core.utils import menus
-from redbot.core.utils.chat_formatting import humanize_list, pagify
+from redbot.core.utils.chat_formatting import box, humanize_list, humanize_timedelta, pagify
 from redbot.core.utils.menus import start_adding_reactions
 from redbot.core.utils.predicates import ReactionPredicate
 
+from .cache import ResultCache
+from .cooldowns import CooldownTracker
 from .converters import (
     ChannelUserRole,
     MultiResponse,
+    SauceIndex,
     Trigger,
     ValidEmoji,
     ValidRegex,
+    sauce_indexes,
 )
+from .edits import ProcessedImages
+from .extractor import ImageExtractor
+from .metrics import Metrics, write_atomic
+from .pipeline import SaucePipeline
+from .prefixes import PrefixCache
+from .ratelimit import QuotaExceeded, QuotaScheduler
+from .reactions import CUSTOM_EMOJI, PendingImages, emoji_key
+from .sauceapi import SauceNaoClient
 from .saucehandler import SauceHandler
+from .scan import ScanCheckpoints, ScanProgress
+from .settings import SettingsCache
+from .singleflight import SingleFlight
+from .triggers import TriggerStore
+from .workers import WorkerPool
 
 log = logging.getLogger("red.xangel-cogs.PictureSauce")
 _ = Translator("PictureSauce", __file__)
 
+# heavy dependencies only imported on first use
+DEFERRED_MODULES = ("saucenao_api", "tldextract", "PIL", "multiprocessing")
+
 
 @cog_i18n(_)
 class PictureSauce(SauceHandler, commands.Cog):
@@ -48,20 +71,135 @@ class PictureSauce(SauceHandler, commands.Cog):
             "remove_role_logs": False,
             "filter_logs": False,
             "bypass": False,
+            "trigger_list": {},
+            "lookup_mode": "url",
+            "dbmask": None,
+            "dbmaski": None,
+            "numres": 6,
+            "min_similarity": 0.0,
+            "reaction_emoji": None,
         }
 
         self.config.register_guild(**default_guild)
-        self.config.register_global(trigger_timeout=1)
-        self.re_pool = Pool()
-        self.triggers = {}
+        self.config.register_global(
+            trigger_timeout=1,
+            cache_ttl=604800,
+            cache_size=50000,
+            max_concurrent_lookups=4,
+            save_interval=60,
+            worker_count=2,
+            worker_backend="thread",
+            pipeline_workers=4,
+            queue_size=100,
+            queue_overflow="drop_lowest",
+            metrics_interval=0,
+            upload_max_size=32 * 1024 * 1024,
+        )
+        self.workers = WorkerPool()
+        self.sauce_api = SauceNaoClient()
+        self.sauce_cache = ResultCache(cog_data_path(self) / "sauce_cache.db")
+        self.sauce_quota = QuotaScheduler()
+        self.lookup_semaphore = asyncio.Semaphore(4)
+        self.extractor = ImageExtractor()
+        self.prefix_cache = PrefixCache(bot)
+        self.settings = SettingsCache(bot, self.config)
+        self.pipeline = SaucePipeline(self.process_job)
+        self.inflight = SingleFlight()
+        self.cooldowns = CooldownTracker()
+        self.processed = ProcessedImages()
+        self.pending = PendingImages()
+        self.scan_checkpoints = ScanCheckpoints(cog_data_path(self) / "scan_checkpoints.json")
+        self.scans: Dict[int, asyncio.Task] = {}
+        self.metrics = Metrics()
+        self.metrics.gauge("queue_depth", lambda: len(self.pipeline))
+        self.metrics.gauge("queue_active", lambda: self.pipeline.active)
+        self.metrics.gauge("queue_dropped", lambda: self.pipeline.dropped)
+        self.metrics.gauge("quota_waiting", lambda: len(self.sauce_quota))
+        self.metrics.gauge("quota_short_tokens", lambda: self.sauce_quota.short.tokens)
+        self.metrics.gauge("quota_long_tokens", lambda: self.sauce_quota.long.tokens)
+        self.metrics.gauge("inflight", lambda: len(self.inflight))
+        self.metrics.gauge("cache_memory_entries", lambda: len(self.sauce_cache))
+        self.metrics.gauge("pending_reactions", lambda: len(self.pending))
+        self.triggers = TriggerStore(on_hydrate=self.reindex_triggers)
+        self.trigger_index = {}
         self.__unload = self.cog_unload
         self.trigger_timeout = 1
+        self.image_max_size = 8 * 1024 * 1024
+        self.upload_max_size = 32 * 1024 * 1024
         self.save_loop.start()
+        self.bot.loop.create_task(self.initialize())
+
+    async def initialize(self) -> None:
+        with self.metrics.time_startup("config"):
+            settings = await self.config.all()
+        self.sauce_cache.ttl = settings["cache_ttl"]
+        self.sauce_cache.max_entries = settings["cache_size"]
+        self.lookup_semaphore = asyncio.Semaphore(settings["max_concurrent_lookups"])
+        self.upload_max_size = settings["upload_max_size"]
+        self.workers.configure(settings["worker_count"], settings["worker_backend"])
+        # the cache must be open before any lookup can run
+        with self.metrics.time_startup("cache"):
+            await self.sauce_cache.initialize()
+        # one bulk read, each guild's triggers are built on its first message
+        with self.metrics.time_startup("hydrate"):
+            loaded = self.triggers.load(await self.config.all_guilds())
+        log.debug("Queued triggers for %s guilds", loaded)
+        with self.metrics.time_startup("tasks"):
+            self.save_loop.change_interval(seconds=settings["save_interval"])
+            self.pipeline.workers = settings["pipeline_workers"]
+            self.pipeline.maxsize = settings["queue_size"]
+            self.pipeline.overflow = settings["queue_overflow"]
+            self.pipeline.start()
+            if settings["metrics_interval"]:
+                self.metrics_loop.change_interval(seconds=settings["metrics_interval"])
+                self.metrics_loop.start()
+
+    @tasks.loop(seconds=60)
+    async def save_loop(self) -> None:
+        await self.save_triggers()
+
+    @save_loop.before_loop
+    async def before_save_loop(self) -> None:
+        await self.bot.wait_until_red_ready()
+
+    @tasks.loop(seconds=60)
+    async def metrics_loop(self) -> None:
+        text = self.metrics.prometheus()
+        path = cog_data_path(self) / "metrics.prom"
+        await self.bot.loop.run_in_executor(None, write_atomic, path, text)
+
+    async def save_triggers(self) -> None:
+        """Write changed triggers to Config"""
+        if not self.triggers.dirty:
+            return
+        saved = await self.triggers.flush(self.config)
+        log.debug("Saved triggers for %s guilds", saved)
+
+    def cog_unload(self):
+        self.save_loop.cancel()
+        self.metrics_loop.cancel()
+        for task in self.scans.values():
+            task.cancel()
+        self.bot.loop.create_task(self.shutdown())
+
+    async def shutdown(self) -> None:
+        """Finish queued lookups then release everything the cog holds"""
+        # a reloaded cog reads Config straight away, so don't hold it up on the queue
+        await self.save_triggers()
+        # cancelled scans still save their checkpoints
+        await asyncio.gather(*self.scans.values(), return_exceptions=True)
+        await self.pipeline.drain()
+        self.inflight.cancel_all()
+        self.sauce_quota.close()
+        # counters bumped by the last lookups
+        await self.save_triggers()
+        await self.sauce_api.close()
+        await self.sauce_cache.close()
+        self.workers.shutdown()
 
     @commands.command()
     async def saucenao(self, ctx, user: str):
-        saucenao_keys = await self.bot.get_shared_api_tokens("saucenao")
-        if saucenao_keys.get("api_key") is None:
+        if await self.settings.api_key() is None:
             return await ctx.send("The SauceNAO API key has not been set.")
         # Use the API key to access content as you normally would
 
@@ -96,42 +234,494 @@ class PictureSauce(SauceHandler, commands.Cog):
     # @checks.is_owner()
     @sauce.command()
     @checks.mod_or_permissions(manage_messages=True)
-    async def set(self, ctx: commands.Context, delete_after: Optional[TimedeltaConverter] = None) -> None:
-        """
-        Add a text response trigger
-        `<name>` name of the trigger.
-        `<regex>` the regex that will determine when to respond.
-        `[delete_after]` Optionally have the text autodelete must include units e.g. 2m.
-        `<text>` response of the trigger.
-        See https://regex101.com/ for help building a regex pattern.
-        See `[p]retrigger explain` or click the link below for more details.
-        [For more details click here.](https://github.com/TrustyJAID/Trusty-cogs/blob/master/retrigger/README.md)
+    async def set(
+        self,
+        ctx: commands.Context,
+        channels: commands.Greedy[Union[discord.TextChannel, discord.CategoryChannel]],
+        delete_after: Optional[TimedeltaConverter] = None,
+    ) -> None:
+        """
+        Look up the sauce for images posted in channels or categories
+        `<channels>` the channels or categories to watch.
+        `[delete_after]` Optionally have the results autodelete must include units e.g. 2m.
         """
         guild = ctx.guild
         author = ctx.message.author.id
 
-        if ctx.guild.id not in self.triggers:
-            self.triggers[ctx.guild.id] = Trigger(
-                author,
-                created_at=ctx.message.id
+        if len(channels) < 1:
+            await ctx.send(_("You must supply 1 or more channels or categories to be allowed"))
+            return
+        triggers = self.triggers.setdefault(guild.id, [])
+        if not triggers:
+            triggers.append(Trigger(author, created_at=ctx.message.id))
+        trigger = triggers[0]
+        trigger.setlist = trigger.setlist | {c.id for c in channels}
+        if delete_after:
+            trigger.delete_after = int(delete_after.total_seconds())
+        self.reindex_triggers(guild.id)
+        await self.triggers.save(self.config, guild.id)
+        await ctx.send(
+            _("Images posted in {channels} will now be looked up.").format(
+                channels=humanize_list([c.mention for c in channels])
+            )
+        )
+
+    @sauce.command(name="mode")
+    @checks.mod_or_permissions(manage_messages=True)
+    async def sauce_mode(self, ctx: commands.Context, mode: commands.Literal["url", "upload"]) -> None:
+        """
+        Choose how images are sent to SauceNAO
+        `url` lets SauceNAO fetch the original image.
+        `upload` downloads the image once and uploads a small thumbnail instead,
+        which is faster for large images and survives expired links.
+        """
+        await self.config.guild(ctx.guild).lookup_mode.set(mode)
+        self.settings.invalidate_guild(ctx.guild.id)
+        await ctx.send(_("Images will now be looked up in {mode} mode.").format(mode=mode))
+
+    @sauce.command(name="uploadsize")
+    @checks.is_owner()
+    async def sauce_upload_size(self, ctx: commands.Context, megabytes: int) -> None:
+        """
+        Set the largest image downloaded for upload mode
+        Larger images are looked up by their URL instead.
+        """
+        if megabytes < 1:
+            await ctx.send(_("The upload size must be at least 1 MB."))
+            return
+        size = megabytes * 1024 * 1024
+        await self.config.upload_max_size.set(size)
+        self.upload_max_size = size
+        await ctx.send(
+            _("Images up to {megabytes} MB will now be uploaded as thumbnails.").format(
+                megabytes=megabytes
+            )
+        )
+
+    @sauce.command(name="reaction")
+    @checks.mod_or_permissions(manage_messages=True)
+    async def sauce_reaction(self, ctx: commands.Context, emoji: Optional[str] = None) -> None:
+        """
+        Only look up images when someone reacts to them
+        `[emoji]` the reaction that asks for the sauce, leave empty to look up
+        every image as soon as it's posted again.
+        """
+        if emoji is None:
+            await self.config.guild(ctx.guild).reaction_emoji.clear()
+            self.settings.invalidate_guild(ctx.guild.id)
+            self.pending.discard_guild(ctx.guild.id)
+            await ctx.send(_("Images will be looked up as soon as they are posted."))
+            return
+        try:
+            emoji = await ValidEmoji().convert(ctx, emoji)
+        except BadArgument as e:
+            await ctx.send(str(e))
+            return
+        if isinstance(emoji, str) and CUSTOM_EMOJI.match(emoji):
+            emoji = "<{}>".format(emoji.strip("<>"))
+        await self.config.guild(ctx.guild).reaction_emoji.set(emoji_key(emoji))
+        self.settings.invalidate_guild(ctx.guild.id)
+        await ctx.send(
+            _("Images will be looked up when someone reacts with {emoji}.").format(emoji=emoji)
+        )
+
+    @sauce.group(name="search")
+    @checks.mod_or_permissions(manage_messages=True)
+    async def sauce_search(self, ctx: commands.Context) -> None:
+        """Choose what SauceNAO searches and which results are shown"""
+
+    @sauce_search.command(name="indexes")
+    async def sauce_search_indexes(self, ctx: commands.Context, *indexes: SauceIndex) -> None:
+        """
+        Only search these SauceNAO indexes
+        `[indexes...]` index names such as `pixiv_images danbooru`, leave empty to search everything.
+        """
+        await self._set_index_mask(ctx, "dbmask", indexes)
+
+    @sauce_search.command(name="exclude")
+    async def sauce_search_exclude(self, ctx: commands.Context, *indexes: SauceIndex) -> None:
+        """
+        Never search these SauceNAO indexes
+        `[indexes...]` index names such as `anime hanime`, leave empty to exclude nothing.
+        """
+        await self._set_index_mask(ctx, "dbmaski", indexes)
+
+    async def _set_index_mask(self, ctx: commands.Context, setting: str, indexes) -> None:
+        mask = 0
+        for index in indexes:
+            mask |= 1 << index
+        await self.config.guild(ctx.guild).set_raw(setting, value=mask or None)
+        self.settings.invalidate_guild(ctx.guild.id)
+        if not indexes:
+            await ctx.send(_("Index filter cleared."))
+            return
+        names = [k for k, v in sauce_indexes().items() if v in indexes]
+        await ctx.send(_("Index filter set to {indexes}.").format(indexes=humanize_list(names)))
+
+    @sauce_search.command(name="results")
+    async def sauce_search_results(self, ctx: commands.Context, count: int) -> None:
+        """
+        Set how many results SauceNAO returns for each lookup
+        """
+        if not 1 <= count <= 16:
+            await ctx.send(_("The result count must be between 1 and 16."))
+            return
+        await self.config.guild(ctx.guild).numres.set(count)
+        self.settings.invalidate_guild(ctx.guild.id)
+        await ctx.send(_("SauceNAO will now return up to {count} results.").format(count=count))
+
+    @sauce_search.command(name="similarity")
+    async def sauce_search_similarity(self, ctx: commands.Context, percent: float) -> None:
+        """
+        Only show results at least this similar to the posted image
+        `<percent>` between 0 and 100.
+        """
+        if not 0 <= percent <= 100:
+            await ctx.send(_("The similarity must be between 0 and 100."))
+            return
+        await self.config.guild(ctx.guild).min_similarity.set(percent)
+        self.settings.invalidate_guild(ctx.guild.id)
+        await ctx.send(_("Results below {percent}% similarity will be hidden.").format(percent=percent))
+
+    @sauce.command(name="cooldown")
+    @checks.mod_or_permissions(manage_messages=True)
+    async def sauce_cooldown(
+        self,
+        ctx: commands.Context,
+        scope: commands.Literal["user", "channel", "guild"],
+        duration: Optional[TimedeltaConverter] = None,
+    ) -> None:
+        """
+        Limit how often images are looked up
+        `<scope>` one of `user`, `channel` or `guild`.
+        `[duration]` how long to wait between lookups e.g. 30s, leave empty to remove the cooldown.
+        """
+        triggers = self.triggers.get(ctx.guild.id)
+        if not triggers:
+            await ctx.send(_("Set some channels first with `{prefix}sauce set`.").format(prefix=ctx.clean_prefix))
+            return
+        for trigger in triggers:
+            if duration:
+                trigger.cooldown[scope] = int(duration.total_seconds())
+            else:
+                trigger.cooldown.pop(scope, None)
+            self.cooldowns.reset(trigger)
+        await self.triggers.save(self.config, ctx.guild.id)
+        if duration:
+            msg = _("Images will be looked up at most once every {duration} per {scope}.").format(
+                duration=humanize_timedelta(timedelta=duration), scope=scope
+            )
+        else:
+            msg = _("The {scope} cooldown has been removed.").format(scope=scope)
+        await ctx.send(msg)
+
+    @sauce.command(name="saveinterval")
+    @checks.is_owner()
+    async def sauce_save_interval(self, ctx: commands.Context, interval: TimedeltaConverter) -> None:
+        """
+        Set how often trigger counters are saved
+        `<interval>` must include units e.g. 5m.
+        """
+        seconds = max(int(interval.total_seconds()), 5)
+        await self.config.save_interval.set(seconds)
+        self.save_loop.change_interval(seconds=seconds)
+        await ctx.send(_("Triggers will now be saved every {seconds} seconds.").format(seconds=seconds))
+
+    @sauce.group(name="cache")
+    @checks.is_owner()
+    async def sauce_cache_settings(self, ctx: commands.Context) -> None:
+        """Manage the SauceNAO lookup cache"""
+
+    @sauce_cache_settings.command(name="ttl")
+    async def sauce_cache_ttl(self, ctx: commands.Context, ttl: TimedeltaConverter) -> None:
+        """
+        Set how long lookup results are kept in the cache
+        `<ttl>` must include units e.g. 7d.
+        """
+        seconds = int(ttl.total_seconds())
+        await self.config.cache_ttl.set(seconds)
+        self.sauce_cache.ttl = seconds
+        await self.sauce_cache.prune()
+        await ctx.send(_("Cached lookups will now expire after {ttl}.").format(ttl=humanize_timedelta(timedelta=ttl)))
+
+    @sauce_cache_settings.command(name="size")
+    async def sauce_cache_size(self, ctx: commands.Context, size: int) -> None:
+        """
+        Set the maximum number of lookup results kept on disk
+        """
+        if size < 1:
+            await ctx.send(_("The cache size must be at least 1."))
+            return
+        await self.config.cache_size.set(size)
+        self.sauce_cache.max_entries = size
+        await self.sauce_cache.prune()
+        await ctx.send(_("The cache will now keep up to {size} results.").format(size=size))
+
+    @sauce_cache_settings.command(name="clear")
+    async def sauce_cache_clear(self, ctx: commands.Context) -> None:
+        """
+        Remove every cached lookup result
+        """
+        await self.sauce_cache.clear()
+        await ctx.send(_("The sauce cache has been cleared."))
+
+    @sauce.command(name="concurrency")
+    @checks.is_owner()
+    async def sauce_concurrency(self, ctx: commands.Context, limit: int) -> None:
+        """
+        Set how many images can be looked up at the same time across all servers
+        """
+        if limit < 1:
+            await ctx.send(_("The limit must be at least 1."))
+            return
+        await self.config.max_concurrent_lookups.set(limit)
+        self.lookup_semaphore = asyncio.Semaphore(limit)
+        await ctx.send(_("Up to {limit} images will now be looked up at once.").format(limit=limit))
+
+    @sauce.command(name="workers")
+    @checks.is_owner()
+    async def sauce_workers(
+        self,
+        ctx: commands.Context,
+        count: int,
+        backend: commands.Literal["thread", "process"] = "thread",
+    ) -> None:
+        """
+        Set the size and type of the pool used for image processing
+        `<count>` the number of workers.
+        `[backend]` either `thread` or `process`, defaults to `thread`.
+        """
+        if count < 1:
+            await ctx.send(_("There must be at least 1 worker."))
+            return
+        await self.config.worker_count.set(count)
+        await self.config.worker_backend.set(backend)
+        self.workers.configure(count, backend)
+        await ctx.send(
+            _("Images will now be processed by up to {count} {backend} workers.").format(
+                count=count, backend=backend
             )
+        )
 
-        trigger_list = await self.config.guild(guild).trigger_list()
-        trigger_list[name] = await new_trigger.to_json()
-        await self.config.guild(guild).trigger_list.set(trigger_list)
-        await ctx.send(_("Trigger `{name}` set.").format(name=name))
+    @sauce.command(name="queue")
+    @checks.is_owner()
+    async def sauce_queue(
+        self,
+        ctx: commands.Context,
+        workers: int,
+        size: int,
+        overflow: commands.Literal["drop_new", "drop_lowest"] = "drop_lowest",
+    ) -> None:
+        """
+        Configure the lookup queue
+        `<workers>` how many messages are processed at once.
+        `<size>` how many messages can wait in the queue.
+        `[overflow]` `drop_new` rejects new messages when the queue is full,
+        `drop_lowest` makes room by dropping lower priority work first.
+        """
+        if workers < 1 or size < 1:
+            await ctx.send(_("The worker count and queue size must be at least 1."))
+            return
+        await self.config.pipeline_workers.set(workers)
+        await self.config.queue_size.set(size)
+        await self.config.queue_overflow.set(overflow)
+        old_pipeline = self.pipeline
+        self.pipeline = SaucePipeline(
+            self.process_job, workers=workers, maxsize=size, overflow=overflow
+        )
+        self.pipeline.start()
+        await old_pipeline.drain()
+        await ctx.send(
+            _("The queue now holds {size} messages processed by {workers} workers.").format(
+                size=size, workers=workers
+            )
+        )
+
+    @sauce.group(name="scan", invoke_without_command=True)
+    @checks.mod_or_permissions(manage_messages=True)
+    async def sauce_scan(
+        self,
+        ctx: commands.Context,
+        channel: discord.TextChannel,
+        limit_or_after: Optional[int] = None,
+    ) -> None:
+        """
+        Look up the sauce for images already posted in a channel
+        `<channel>` the channel to scan, oldest messages first.
+        `[limit|after]` how many messages to scan or a message ID to start after.
+        Scans continue from where the last scan of the channel stopped.
+        """
+        if channel.id in self.scans:
+            await ctx.send(_("{channel} is already being scanned.").format(channel=channel.mention))
+            return
+        if not channel.permissions_for(ctx.me).read_message_history:
+            await ctx.send(
+                _("I need permission to read the message history of {channel}.").format(
+                    channel=channel.mention
+                )
+            )
+            return
+        limit = None
+        after = self.scan_checkpoints.get(channel.id)
+        if limit_or_after is not None:
+            # message IDs are snowflakes, far larger than any sensible limit
+            if limit_or_after > 10 ** 12:
+                after = limit_or_after
+            else:
+                limit = max(limit_or_after, 1)
+        index = self.guild_index(ctx.guild.id)
+        triggers = index.for_channel(channel) if index else ()
+        trigger = triggers[0] if triggers else Trigger(ctx.author.id, created_at=ctx.message.id)
+        self.scans[channel.id] = asyncio.create_task(
+            self.run_scan(ctx, channel, trigger, limit, after)
+        )
+
+    async def run_scan(
+        self,
+        ctx: commands.Context,
+        channel: discord.TextChannel,
+        trigger: Trigger,
+        limit: Optional[int],
+        after: Optional[int],
+    ) -> None:
+        progress = ScanProgress(channel.id, after)
+        status = await ctx.send(_("Scanning {channel}...").format(channel=channel.mention))
+        reported = time.monotonic()
+        stopped = None
+        try:
+            async for progress in self.scan_channel(
+                channel, trigger, progress, limit=limit, after=after
+            ):
+                self.scan_checkpoints.set(channel.id, progress.last_id)
+                if time.monotonic() - reported >= 15:
+                    reported = time.monotonic()
+                    await self.save_scan_checkpoints()
+                    await status.edit(content=self.scan_status(channel, progress))
+        except QuotaExceeded:
+            stopped = _("The daily SauceNAO limit was reached, run the scan again to continue.")
+        except discord.Forbidden:
+            stopped = _("I lost access to {channel}.").format(channel=channel.mention)
+        except asyncio.CancelledError:
+            stopped = _("The scan was stopped, run it again to continue.")
+            raise
+        except Exception:
+            log.exception("Error scanning %r", channel)
+            stopped = _("The scan failed, check your logs for details.")
+        finally:
+            self.scans.pop(channel.id, None)
+            await self.save_scan_checkpoints()
+            msg = self.scan_status(channel, progress, done=stopped is None)
+            if stopped:
+                msg += "\n" + stopped
+            try:
+                await status.edit(content=msg)
+            except discord.HTTPException:
+                pass
 
-        if len(channel_user_role) < 1:
-            await ctx.send("You must supply 1 or more channels users or roles to be allowed")
+    @staticmethod
+    def scan_status(channel: discord.TextChannel, progress: ScanProgress, done: bool = False) -> str:
+        if done:
+            msg = _("Finished scanning {channel}: ")
+        else:
+            msg = _("Scanning {channel}: ")
+        msg += _("{messages} messages and {images} images in {elapsed} ({rate:.1f} messages/s).")
+        return msg.format(
+            channel=channel.mention,
+            messages=progress.messages,
+            images=progress.images,
+            elapsed=humanize_timedelta(seconds=max(int(progress.elapsed), 1)),
+            rate=progress.rate,
+        )
+
+    async def save_scan_checkpoints(self) -> None:
+        await self.bot.loop.run_in_executor(None, self.scan_checkpoints.save)
+
+    @sauce_scan.command(name="stop")
+    async def sauce_scan_stop(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Stop scanning a channel, the next scan continues where it stopped"""
+        task = self.scans.get(channel.id)
+        if task is None:
+            await ctx.send(_("{channel} is not being scanned.").format(channel=channel.mention))
+            return
+        task.cancel()
+        await ctx.send(_("Stopping the scan of {channel}.").format(channel=channel.mention))
+
+    @sauce_scan.command(name="reset")
+    async def sauce_scan_reset(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Forget where the last scan of a channel stopped"""
+        self.scan_checkpoints.clear(channel.id)
+        await self.save_scan_checkpoints()
+        await ctx.send(
+            _("The next scan of {channel} will start from the beginning.").format(
+                channel=channel.mention
+            )
+        )
+
+    @sauce.group(name="stats", invoke_without_command=True)
+    @checks.is_owner()
+    async def sauce_stats(self, ctx: commands.Context) -> None:
+        """Show lookup timings, counters and queue state"""
+        uptime = humanize_timedelta(seconds=max(int(time.time() - self.metrics.started), 1))
+        stage_rows = [
+            "{:<14}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}".format(*row)
+            for row in self.metrics.stage_rows()
+        ]
+        msg = _("Collected over {uptime}").format(uptime=uptime) + "\n"
+        msg += box(
+            "{:<14}{:>8}{:>10}{:>10}{:>10}{:>10}\n".format("stage", "count", "p50 ms", "p95 ms", "p99 ms", "max ms")
+            + ("\n".join(stage_rows) or _("No samples yet"))
+        )
+        counters = ["{:<24}{:>10}".format(k, v) for k, v in sorted(self.metrics.counters.items())]
+        gauges = [
+            "{:<24}{:>10}".format(k, round(f(), 2)) for k, f in sorted(self.metrics.gauges.items())
+        ]
+        msg += box("\n".join(counters + [""] + gauges))
+        for page in pagify(msg, delims=["```"], priority=True, shorten_by=0):
+            await ctx.send(page)
+
+    @sauce_stats.command(name="reset")
+    async def sauce_stats_reset(self, ctx: commands.Context) -> None:
+        """Clear every collected timing and counter"""
+        self.metrics.reset()
+        await ctx.send(_("Stats have been reset."))
+
+    @sauce_stats.command(name="export")
+    async def sauce_stats_export(
+        self, ctx: commands.Context, interval: Optional[TimedeltaConverter] = None
+    ) -> None:
+        """
+        Periodically write stats as Prometheus text to the cog's data folder
+        `[interval]` how often to write e.g. 30s, leave empty to stop exporting.
+        """
+        if interval is None:
+            await self.config.metrics_interval.set(0)
+            self.metrics_loop.cancel()
+            await ctx.send(_("Stats will no longer be exported."))
             return
-        for obj in channel_user_role:
-            if obj.id not in trigger.whitelist:
-                async with self.config.guild(ctx.guild).trigger_list() as trigger_list:
-                    trigger.whitelist.append(obj.id)
-                    trigger_list[trigger.name] = await trigger.to_json()
-        await self.remove_trigger_from_cache(ctx.guild.id, trigger)
+        seconds = max(int(interval.total_seconds()), 5)
+        await self.config.metrics_interval.set(seconds)
+        self.metrics_loop.change_interval(seconds=seconds)
+        if not self.metrics_loop.is_running():
+            self.metrics_loop.start()
+        await ctx.send(
+            _("Stats will be written to `{path}` every {seconds} seconds.").format(
+                path=cog_data_path(self) / "metrics.prom", seconds=seconds
+            )
+        )
 
-        await ctx.send("This command is: sauce set")
+    @sauce.command(name="startup")
+    @checks.is_owner()
+    async def sauce_startup(self, ctx: commands.Context) -> None:
+        """Show how long the cog took to import, load its data and start its tasks"""
+        rows = ["{:<14}{:>10.1f}".format(k, v * 1000) for k, v in self.metrics.startup.items()]
+        rows.append("{:<14}{:>10.1f}".format("total", sum(self.metrics.startup.values()) * 1000))
+        deferred = [
+            "{:<14}{:>10}".format(name, _("loaded") if name in sys.modules else _("deferred"))
+            for name in DEFERRED_MODULES
+        ]
+        msg = box("{:<14}{:>10}\n".format("stage", "ms") + "\n".join(rows))
+        msg += box("\n".join(deferred))
+        await ctx.send(msg)
 
     @sauce.command()
     async def block(self, ctx: commands.Context) -> None:
@@ -151,7 +741,7 @@ class PictureSauce(SauceHandler, commands.Cog):
         # Your code will go here
         await ctx.send("This command is: sauce reset")
 
-    @set.command()
+    @sauce.command()
     async def set_all(self, ctx: commands.Context) -> None:
         """This does stuff!"""
         # Your code will go here
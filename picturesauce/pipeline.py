@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Literal, NamedTuple, Optional
+
+import discord
+
+from .converters import Trigger
+from .extractor import ImageCandidate
+
+log = logging.getLogger("red.xangel-cogs.PictureSauce")
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+Overflow = Literal["drop_new", "drop_lowest"]
+
+
+class SauceJob(NamedTuple):
+    """A message waiting for its images to be looked up"""
+
+    message: discord.Message
+    trigger: Trigger
+    images: List[ImageCandidate]
+    priority: int = PRIORITY_NORMAL
+
+
+class SaucePipeline:
+    """
+    Bounded priority queue of lookup jobs consumed by a pool of worker tasks
+
+    `submit` never waits. When the queue is full the `drop_new` policy
+    rejects the incoming job while `drop_lowest` evicts the newest job of
+    the lowest priority class if the incoming job outranks it.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[SauceJob], Awaitable[None]],
+        *,
+        workers: int = 4,
+        maxsize: int = 100,
+        overflow: Overflow = "drop_lowest",
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self._queues: Dict[int, Deque[SauceJob]] = {p: deque() for p in PRIORITIES}
+        self._available = asyncio.Semaphore(0)
+        self._tasks: List[asyncio.Task] = []
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def start(self) -> None:
+        for number in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(number)))
+
+    def submit(self, job: SauceJob) -> bool:
+        """Queue a job, returns False if it was dropped"""
+        if self._closed:
+            return False
+        if len(self) >= self.maxsize:
+            if self.overflow == "drop_new" or not self._evict_below(job.priority):
+                self.dropped += 1
+                log.debug("Sauce queue full, dropping job for message %s", job.message.id)
+                return False
+            self._queues[job.priority].append(job)
+            return True
+        self._queues[job.priority].append(job)
+        self._idle.clear()
+        self._available.release()
+        return True
+
+    def _evict_below(self, priority: int) -> bool:
+        for lower in reversed(PRIORITIES):
+            if lower <= priority:
+                return False
+            if self._queues[lower]:
+                evicted = self._queues[lower].pop()
+                self.dropped += 1
+                log.debug("Sauce queue full, evicted job for message %s", evicted.message.id)
+                return True
+        return False
+
+    def _next(self) -> Optional[SauceJob]:
+        for priority in PRIORITIES:
+            if self._queues[priority]:
+                return self._queues[priority].popleft()
+        return None
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            await self._available.acquire()
+            job = self._next()
+            if job is None:
+                continue
+            self._active += 1
+            try:
+                await self.handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Sauce worker %s failed on message %s", number, job.message.id)
+            finally:
+                self._active -= 1
+                if not self._active and not len(self):
+                    self._idle.set()
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Stop accepting jobs, finish queued ones for up to `timeout` seconds then stop"""
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning("Dropping %s queued sauce jobs on shutdown", len(self))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
@@ -0,0 +1,79 @@
+import re
+import time
+from typing import Dict, Iterable, Optional, Pattern, Tuple
+
+import discord
+from redbot.core.bot import Red
+
+# commands which change prefixes, their completion clears the cache
+PREFIX_COMMANDS = ("set prefix", "set serverprefix")
+
+
+class PrefixMatcher:
+    """
+    Matches the start of a message against every prefix with one anchored pattern
+    """
+
+    def __init__(self, prefixes: Iterable[str]):
+        # longest first so "!!" wins over "!"
+        ordered = sorted({p for p in prefixes if p}, key=len, reverse=True)
+        self.pattern: Optional[Pattern] = None
+        if ordered:
+            self.pattern = re.compile(
+                r"(?:{})(\S+)".format("|".join(re.escape(p) for p in ordered))
+            )
+
+    def command_name(self, content: str) -> Optional[str]:
+        """Return the command name following a prefix if the message starts with one"""
+        if self.pattern is None:
+            return None
+        match = self.pattern.match(content)
+        if match is None:
+            return None
+        return match.group(1)
+
+
+class PrefixCache:
+    """
+    Caches compiled prefix matchers per guild and known command names
+
+    Matchers expire after `ttl` seconds and are cleared whenever a prefix
+    command completes. Command names are forgotten whenever the number of
+    registered commands changes or too many unknown words pile up.
+    """
+
+    def __init__(self, bot: Red, ttl: float = 300):
+        self.bot = bot
+        self.ttl = ttl
+        self._matchers: Dict[Optional[int], Tuple[float, PrefixMatcher]] = {}
+        self._commands: Dict[str, bool] = {}
+        self._command_count = 0
+
+    async def matcher(self, message: discord.Message) -> PrefixMatcher:
+        guild_id = message.guild.id if message.guild else None
+        now = time.monotonic()
+        cached = self._matchers.get(guild_id)
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1]
+        prefixes = await self.bot.command_prefix(self.bot, message)
+        if isinstance(prefixes, str):
+            prefixes = [prefixes]
+        matcher = PrefixMatcher(prefixes)
+        self._matchers[guild_id] = (now, matcher)
+        return matcher
+
+    def is_command(self, name: str) -> bool:
+        count = len(self.bot.all_commands)
+        if count != self._command_count or len(self._commands) > 4096:
+            self._commands.clear()
+            self._command_count = count
+        known = self._commands.get(name)
+        if known is None:
+            known = self._commands[name] = self.bot.get_command(name) is not None
+        return known
+
+    def invalidate(self, guild_id: Optional[int] = None) -> None:
+        if guild_id is None:
+            self._matchers.clear()
+        else:
+            self._matchers.pop(guild_id, None)
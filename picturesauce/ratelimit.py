@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Deque, Optional
+
+if TYPE_CHECKING:
+    from saucenao_api.containers import SauceResponse
+
+log = logging.getLogger("red.xangel-cogs.PictureSauce")
+
+
+class QuotaExceeded(Exception):
+    """Raised when a lookup can't be scheduled within the SauceNAO quota"""
+
+
+class TokenBucket:
+    """
+    Token bucket refilling `capacity` tokens evenly over `period` seconds
+    """
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, tokens: int = 1) -> float:
+        """Seconds until `tokens` tokens are available"""
+        self._refill(now)
+        tokens = min(tokens, self.capacity)
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def sync(self, remaining: int, limit: Optional[int] = None) -> None:
+        """Adopt the remaining quota reported by the API"""
+        self._refill(time.monotonic())
+        if limit:
+            self.capacity = limit
+        self.tokens = min(self.tokens, float(max(remaining, 0)))
+
+    def empty(self) -> None:
+        self._refill(time.monotonic())
+        self.tokens = 0.0
+
+
+class QuotaScheduler:
+    """
+    Schedules SauceNAO lookups under the 30 second and 24 hour quotas
+
+    Each guild gets its own queue and queued lookups are released round robin
+    so a single busy guild can't starve the others. Lookups that can't run
+    within `max_wait` seconds, or that would overflow their guild's queue,
+    are rejected with `QuotaExceeded` instead of being sent to the API.
+    """
+
+    SHORT_PERIOD = 30
+    LONG_PERIOD = 86400
+
+    def __init__(
+        self,
+        *,
+        short_limit: int = 4,
+        long_limit: int = 100,
+        max_queue: int = 10,
+        max_wait: float = 60.0,
+    ):
+        self.short = TokenBucket(short_limit, self.SHORT_PERIOD)
+        self.long = TokenBucket(long_limit, self.LONG_PERIOD)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.rejected = 0
+        self._queues: "OrderedDict[int, Deque[asyncio.Future]]" = OrderedDict()
+        # created with the pump so it belongs to the loop that runs it
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _reject(self, reason: str, guild_id: int) -> QuotaExceeded:
+        self.rejected += 1
+        log.debug("Dropping SauceNAO lookup for guild %s: %s", guild_id, reason)
+        return QuotaExceeded(reason)
+
+    async def acquire(self, guild_id: int) -> None:
+        """Wait for this guild's turn to spend one lookup"""
+        if self.long.wait_time(time.monotonic()) > self.max_wait:
+            raise self._reject("daily limit reached", guild_id)
+        queue = self._queues.setdefault(guild_id, deque())
+        if len(queue) >= self.max_queue:
+            raise self._reject("guild queue is full", guild_id)
+        fut = asyncio.get_running_loop().create_future()
+        queue.append(fut)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._pump(self._wakeup))
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if not fut.done():
+                fut.cancel()
+                raise self._reject("timed out waiting for quota", guild_id)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+
+    async def wait_idle(self, tokens: int = 1, poll: float = 1.0) -> None:
+        """
+        Wait until no lookups are queued and `tokens` more fit in the quota
+
+        Lets background work like history scans yield to live lookups.
+        """
+        while True:
+            now = time.monotonic()
+            if self.long.wait_time(now, tokens) > self.max_wait:
+                raise QuotaExceeded("daily limit reached")
+            wait = self.short.wait_time(now, tokens)
+            if not self._queues and wait <= 0:
+                return
+            await asyncio.sleep(max(wait, poll))
+
+    async def _pump(self, wakeup: asyncio.Event) -> None:
+        while True:
+            if not self._queues:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            now = time.monotonic()
+            wait = max(self.short.wait_time(now), self.long.wait_time(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            guild_id, queue = next(iter(self._queues.items()))
+            fut = queue.popleft()
+            if queue:
+                self._queues.move_to_end(guild_id)
+            else:
+                del self._queues[guild_id]
+            if fut.done():
+                continue
+            self.short.take(now)
+            self.long.take(now)
+            fut.set_result(None)
+
+    def update(self, response: "SauceResponse") -> None:
+        """Sync the buckets with the quota reported in a response"""
+        try:
+            self.short.sync(response.short_remaining, int(response.short_limit))
+            self.long.sync(response.long_remaining, int(response.long_limit))
+        except (TypeError, ValueError):
+            log.debug("Unexpected quota values in %r", response)
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        for queue in self._queues.values():
+            for fut in queue:
+                fut.cancel()
+        self._queues.clear()
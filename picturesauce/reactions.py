@@ -0,0 +1,62 @@
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import discord
+
+from .extractor import ImageCandidate
+
+CUSTOM_EMOJI = re.compile(r"<?a?:[a-zA-Z0-9_]+:([0-9]+)>?$")
+
+
+def emoji_key(emoji: Union[discord.PartialEmoji, str]) -> str:
+    """
+    Key an emoji by its ID when it's custom or by itself when it's unicode
+
+    Accepts a reaction payload's emoji or the output of `ValidEmoji`.
+    """
+    if isinstance(emoji, str):
+        match = CUSTOM_EMOJI.match(emoji)
+        return match.group(1) if match else emoji
+    return str(emoji.id) if emoji.id else emoji.name
+
+
+class PendingImages:
+    """
+    Images waiting for someone to ask for their sauce with a reaction
+
+    Each guild keeps a ring of its most recent `max_per_guild` messages
+    with images, so a busy guild only pushes out its own oldest entries.
+    """
+
+    def __init__(self, max_per_guild: int = 500):
+        self.max_per_guild = max_per_guild
+        self._guilds: Dict[int, "OrderedDict[int, Tuple[ImageCandidate, ...]]"] = {}
+
+    def __len__(self) -> int:
+        return sum(len(ring) for ring in self._guilds.values())
+
+    def add(self, guild_id: int, message_id: int, images: List[ImageCandidate]) -> None:
+        """Remember a message's images, merging with any already stored for it"""
+        ring = self._guilds.setdefault(guild_id, OrderedDict())
+        stored = ring.get(message_id, ())
+        keys = {i.key for i in stored}
+        ring[message_id] = stored + tuple(i for i in images if i.key not in keys)
+        while len(ring) > self.max_per_guild:
+            ring.popitem(last=False)
+
+    def get(self, guild_id: int, message_id: int) -> Optional[Tuple[ImageCandidate, ...]]:
+        ring = self._guilds.get(guild_id)
+        return ring.get(message_id) if ring else None
+
+    def pop(self, guild_id: int, message_id: int) -> Optional[Tuple[ImageCandidate, ...]]:
+        ring = self._guilds.get(guild_id)
+        if not ring:
+            return None
+        images = ring.pop(message_id, None)
+        if not ring:
+            del self._guilds[guild_id]
+        return images
+
+    def discard_guild(self, guild_id: int) -> None:
+        self._guilds.pop(guild_id, None)
@@ -0,0 +1,87 @@
+import logging
+from typing import List, Optional
+
+import discord
+from discord.http import Route
+from redbot import VersionInfo, version_info
+
+log = logging.getLogger("red.xangel-cogs.PictureSauce")
+
+MAX_EMBEDS = 10
+MAX_EMBED_CHARACTERS = 6000
+
+
+class ReplyBatch:
+    """
+    Collects the result embeds for one message and sends them together
+
+    Embeds are packed into as few messages as Discord allows, at most
+    10 embeds and 6000 characters each, instead of one message per image.
+    """
+
+    def __init__(
+        self,
+        channel: discord.TextChannel,
+        reference: Optional[discord.Message] = None,
+        delete_after: Optional[float] = None,
+    ):
+        self.channel = channel
+        self.reference = reference
+        self.delete_after = delete_after
+        self.embeds: List[discord.Embed] = []
+
+    def __len__(self) -> int:
+        return len(self.embeds)
+
+    def add(self, embed: discord.Embed) -> None:
+        self.embeds.append(embed)
+
+    def chunks(self) -> List[List[discord.Embed]]:
+        chunks: List[List[discord.Embed]] = []
+        current: List[discord.Embed] = []
+        size = 0
+        for embed in self.embeds:
+            length = len(embed)
+            if current and (len(current) >= MAX_EMBEDS or size + length > MAX_EMBED_CHARACTERS):
+                chunks.append(current)
+                current, size = [], 0
+            current.append(embed)
+            size += length
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def send(self) -> List[discord.Message]:
+        sent = []
+        for chunk in self.chunks():
+            sent.append(await self._send_chunk(chunk))
+        return sent
+
+    async def _send_chunk(self, embeds: List[discord.Embed]) -> discord.Message:
+        reference = self.reference
+        if reference is not None and version_info < VersionInfo.from_str("3.4.6"):
+            reference = None
+        if len(embeds) == 1:
+            if reference is not None:
+                return await self.channel.send(
+                    embed=embeds[0], delete_after=self.delete_after, reference=reference
+                )
+            return await self.channel.send(embed=embeds[0], delete_after=self.delete_after)
+        if discord.version_info.major >= 2:
+            return await self.channel.send(
+                embeds=embeds, delete_after=self.delete_after, reference=reference
+            )
+        # discord.py 1.x can't send several embeds at once so post the payload directly
+        state = self.channel._state
+        payload = {
+            "embeds": [e.to_dict() for e in embeds],
+            "allowed_mentions": {"parse": [], "replied_user": True},
+        }
+        if reference is not None:
+            payload["message_reference"] = reference.to_message_reference_dict()
+        route = Route("POST", "/channels/{channel_id}/messages", channel_id=self.channel.id)
+        data = await state.http.request(route, json=payload)
+        message = state.create_message(channel=self.channel, data=data)
+        if self.delete_after is not None:
+            await message.delete(delay=self.delete_after)
+        return message
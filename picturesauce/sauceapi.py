@@ -0,0 +1,190 @@
+import logging
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Mapping, NamedTuple, Optional, Union
+
+# already loaded by discord.py so importing it here costs nothing
+import aiohttp
+
+if TYPE_CHECKING:
+    from saucenao_api.containers import SauceResponse
+
+log = logging.getLogger("red.xangel-cogs.PictureSauce")
+
+# saucenao_api.params.DB.ALL and Hide.NONE, saucenao_api itself is only
+# imported once the first lookup runs since it pulls in requests
+DB_ALL = 999
+HIDE_NONE = 0
+
+
+class SearchOptions(NamedTuple):
+    """Which SauceNAO indexes to search and how many results to return"""
+
+    dbmask: Optional[int] = None
+    dbmaski: Optional[int] = None
+    numres: int = 6
+
+    @classmethod
+    def from_settings(cls, settings: Mapping[str, Any]) -> "SearchOptions":
+        return cls(settings.get("dbmask"), settings.get("dbmaski"), settings.get("numres", 6))
+
+    @property
+    def signature(self) -> str:
+        """Suffix for cache keys, empty for the default search"""
+        if self == SearchOptions():
+            return ""
+        return "|m{}|i{}|n{}".format(self.dbmask or 0, self.dbmaski or 0, self.numres)
+
+    def params(self) -> Dict[str, Any]:
+        return self._asdict()
+
+
+class SauceNaoClient:
+    """
+    Asyncio SauceNAO client sharing one pooled aiohttp session
+
+    Mirrors the request handling of `saucenao_api.SauceNao` so lookups
+    return the same `SauceResponse` objects without blocking the event loop.
+    The session is opened on first use rather than when the cog loads.
+    """
+
+    SAUCENAO_URL = "https://saucenao.com/search.php"
+
+    def __init__(
+        self,
+        *,
+        limit: int = 8,
+        keepalive_timeout: float = 30.0,
+        timeout: float = 20.0,
+    ):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                raise_for_status=False,
+            )
+        return self._session
+
+    @staticmethod
+    def build_params(
+        api_key: Optional[str],
+        *,
+        dbmask: Optional[int] = None,
+        dbmaski: Optional[int] = None,
+        db: int = DB_ALL,
+        numres: int = 6,
+        hide: int = HIDE_NONE,
+    ) -> Dict[str, Any]:
+        params: Dict[str, Any] = {}
+        if api_key is not None:
+            params["api_key"] = api_key
+        if dbmask is not None:
+            params["dbmask"] = dbmask
+        if dbmaski is not None:
+            params["dbmaski"] = dbmaski
+        params["db"] = db
+        params["numres"] = numres
+        params["hide"] = hide
+        params["output_type"] = 2
+        return params
+
+    async def from_url(self, url: str, api_key: Optional[str], **kwargs) -> "SauceResponse":
+        """Lookup an image by its public URL"""
+        params = self.build_params(api_key, **kwargs)
+        params["url"] = url
+        return await self._search(params)
+
+    async def from_file(
+        self, file: Union[bytes, BinaryIO], api_key: Optional[str], **kwargs
+    ) -> "SauceResponse":
+        """Lookup an image by uploading its contents"""
+        params = self.build_params(api_key, **kwargs)
+        data = aiohttp.FormData()
+        data.add_field("file", file, filename="image.jpg", content_type="image/jpeg")
+        return await self._search(params, data)
+
+    async def download(self, url: str, max_size: int) -> Optional[bytes]:
+        """Fetch an image giving up once it is larger than `max_size` bytes"""
+        async with self.session.get(url) as resp:
+            if resp.status != 200:
+                return None
+            if resp.content_length and resp.content_length > max_size:
+                return None
+            data = bytearray()
+            async for chunk in resp.content.iter_chunked(65536):
+                data.extend(chunk)
+                if len(data) > max_size:
+                    return None
+        return bytes(data)
+
+    async def _search(
+        self, params: Dict[str, Any], data: Optional[aiohttp.FormData] = None
+    ) -> "SauceResponse":
+        from saucenao_api.containers import SauceResponse
+        from saucenao_api.errors import (
+            BadFileSizeError,
+            BadKeyError,
+            LongLimitReachedError,
+            ShortLimitReachedError,
+            UnknownApiError,
+        )
+
+        async with self.session.post(self.SAUCENAO_URL, params=params, data=data) as resp:
+            status_code = resp.status
+            if status_code == 200:
+                parsed = await resp.json(content_type=None)
+                return SauceResponse(self._verify_response(parsed, params))
+            # SauceNAO answers 200 with user_id 0 for most bad keys
+            if status_code == 403:
+                raise BadKeyError("Invalid API key")
+            if status_code == 413:
+                raise BadFileSizeError("File is too large")
+            if status_code == 429:
+                parsed = await resp.json(content_type=None)
+                if "Daily" in parsed.get("header", {}).get("message", ""):
+                    raise LongLimitReachedError("24 hours limit reached")
+                raise ShortLimitReachedError("30 seconds limit reached")
+        raise UnknownApiError(f"Server returned status code {status_code}")
+
+    @staticmethod
+    def _verify_response(parsed: dict, params: Dict[str, Any]) -> dict:
+        from saucenao_api.errors import (
+            BadKeyError,
+            LongLimitReachedError,
+            ShortLimitReachedError,
+            UnknownClientError,
+            UnknownServerError,
+        )
+
+        header = parsed["header"]
+        status = header["status"]
+        user_id = int(header["user_id"])
+        if status < 0:
+            raise UnknownClientError("Unknown client error, status < 0")
+        elif status > 0:
+            raise UnknownServerError("Unknown API error, status > 0")
+        elif user_id < 0:
+            raise UnknownServerError("Unknown API error, user_id < 0")
+        elif user_id == 0 and "api_key" in params:
+            raise BadKeyError("Invalid API key")
+
+        if header["short_remaining"] < 0:
+            raise ShortLimitReachedError("30 seconds limit reached")
+        elif header["long_remaining"] < 0:
+            raise LongLimitReachedError("24 hours limit reached")
+        return parsed
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
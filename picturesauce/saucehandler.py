@@ -5,16 +5,24 @@ import os
 import random
 import re
 import string
-import tldextract
 from copy import copy
 from datetime import datetime
 from io import BytesIO
-import multiprocessing as mp
-from multiprocessing.pool import Pool
-from saucenao_api import SauceNao
-from typing import Any, Dict, List, Literal, Pattern, Tuple, cast, Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Literal,
+    Pattern,
+    Set,
+    Tuple,
+    cast,
+    Optional,
+)
+from urllib.parse import quote
 
-import aiohttp
 import discord
 from redbot import VersionInfo, version_info
 from redbot.core import Config, commands, modlog
@@ -23,9 +31,30 @@ from redbot.core.data_manager import cog_data_path
 from redbot.core.i18n import Translator
 from redbot.core.utils.chat_formatting import escape, humanize_list
 
+from . import imaging
+from .cache import ResultCache
 from .converters import Trigger
+from .cooldowns import CooldownTracker
+from .edits import ProcessedImages
+from .extractor import ImageCandidate, ImageExtractor
+from .metrics import Metrics
+from .pipeline import PRIORITY_HIGH, PRIORITY_NORMAL, SauceJob, SaucePipeline
+from .prefixes import PREFIX_COMMANDS, PrefixCache
+from .ratelimit import QuotaExceeded, QuotaScheduler
+from .reactions import PendingImages, emoji_key
+from .replies import ReplyBatch
+from .scan import ScanProgress
+from .settings import COLOUR_COMMANDS, SettingsCache
+from .singleflight import SingleFlight
+from .sources import source_label
+from .triggers import TriggerIndex, TriggerStore
+from .workers import WorkerPool
+from .sauceapi import SauceNaoClient, SearchOptions
 # from .message import ReTriggerMessage
 
+if TYPE_CHECKING:
+    from saucenao_api.containers import SauceResponse
+
 log = logging.getLogger("red.xangel-cogs.PictureSauce")
 _ = Translator("PictureSauce", __file__)
 
@@ -37,16 +66,65 @@ class SauceHandler:
 
     config: Config
     bot: Red
-    re_pool: Pool
-    triggers: Dict[int, Trigger]
+    workers: WorkerPool
+    sauce_api: SauceNaoClient
+    sauce_cache: ResultCache
+    sauce_quota: QuotaScheduler
+    lookup_semaphore: asyncio.Semaphore
+    extractor: ImageExtractor
+    prefix_cache: PrefixCache
+    settings: SettingsCache
+    pipeline: SaucePipeline
+    inflight: SingleFlight
+    cooldowns: CooldownTracker
+    processed: ProcessedImages
+    pending: PendingImages
+    metrics: Metrics
+    triggers: TriggerStore
+    trigger_index: Dict[int, TriggerIndex]
     trigger_timeout: int
+    image_max_size: int
+    upload_max_size: int
 
     def __init__(self, *args):
         self.config: Config
         self.bot: Red
-        self.re_pool: Pool
-        self.triggers: Dict[int, Trigger]
+        self.workers: WorkerPool
+        self.sauce_api: SauceNaoClient
+        self.sauce_cache: ResultCache
+        self.sauce_quota: QuotaScheduler
+        self.lookup_semaphore: asyncio.Semaphore
+        self.extractor: ImageExtractor
+        self.prefix_cache: PrefixCache
+        self.settings: SettingsCache
+        self.pipeline: SaucePipeline
+        self.inflight: SingleFlight
+        self.cooldowns: CooldownTracker
+        self.processed: ProcessedImages
+        self.pending: PendingImages
+        self.metrics: Metrics
+        self.triggers: TriggerStore
+        self.trigger_index: Dict[int, TriggerIndex]
         self.trigger_timeout: int
+        self.image_max_size: int
+        self.upload_max_size: int
+
+    def reindex_triggers(self, guild_id: int) -> None:
+        """Rebuild the channel index after a guild's triggers load or change"""
+        triggers = self.triggers.get(guild_id)
+        if triggers:
+            self.trigger_index[guild_id] = TriggerIndex(triggers)
+        else:
+            self.trigger_index.pop(guild_id, None)
+
+    def guild_index(self, guild_id: int) -> Optional[TriggerIndex]:
+        """Return a guild's channel index, building its triggers on first use"""
+        index = self.trigger_index.get(guild_id)
+        if index is None and guild_id in self.triggers.pending:
+            # hydrating calls reindex_triggers through TriggerStore.on_hydrate
+            self.triggers.get(guild_id)
+            index = self.trigger_index.get(guild_id)
+        return index
 
     async def check_set_list(self, trigger: Trigger, message: discord.Message):
         # author: discord.Member = cast(discord.Member, message.author)
@@ -73,81 +151,267 @@ class SauceHandler:
 
     async def check_is_command(self, message: discord.Message) -> bool:
         """Checks if the message is a bot command"""
-        prefix_list = await self.bot.command_prefix(self.bot, message)
-        msg = message.content
-        is_command = False
-        for prefix in prefix_list:
-            if msg.startswith(prefix):
-                # Don't run a trigger if it's the name of a command
-                command_text = msg.replace(prefix, "").split(" ")[0]
-                if not command_text:
-                    continue
-                command = self.bot.get_command(command_text)
-                if command:
-                    is_command = True
-        return is_command
-
-    async def perform_trigger(self, message: discord.Message, trigger: Trigger) -> None:
+        matcher = await self.prefix_cache.matcher(message)
+        command_text = matcher.command_name(message.content)
+        if not command_text:
+            return False
+        return self.prefix_cache.is_command(command_text)
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx: commands.Context) -> None:
+        name = ctx.command.qualified_name
+        if name.startswith(PREFIX_COMMANDS):
+            self.prefix_cache.invalidate()
+        elif name.startswith(COLOUR_COMMANDS):
+            self.settings.invalidate_colours()
+
+    @commands.Cog.listener()
+    async def on_red_api_tokens_update(self, service_name: str, api_tokens: Dict[str, str]) -> None:
+        if service_name == "saucenao":
+            self.settings.update_api_key(api_tokens)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self.settings.invalidate_guild(guild.id)
+        self.prefix_cache.invalidate(guild.id)
+        self.pending.discard_guild(guild.id)
+
+    async def prepare_image(
+        self, url: str, make_thumbnail: bool = False
+    ) -> Tuple[Optional[int], Optional[bytes]]:
+        """
+        Download an image once and compute its perceptual hash off the event loop
+
+        Also downscales it to a JPEG thumbnail for upload mode when asked,
+        which accepts larger images since only the thumbnail is sent on.
+        """
+        max_size = self.upload_max_size if make_thumbnail else self.image_max_size
+        try:
+            with self.metrics.time("download"):
+                data = await self.sauce_api.download(url, max_size)
+            if data is None:
+                return None, None
+            with self.metrics.time("prepare_image"):
+                return await self.workers.run(imaging.prepare_image, data, make_thumbnail)
+        except Exception:
+            log.debug("Could not process %r", url, exc_info=True)
+            return None, None
+
+    async def lookup_sauce(
+        self, image: ImageCandidate, api_key: Optional[str], guild: discord.Guild
+    ) -> Optional["SauceResponse"]:
+        """
+        Find the sauce for an image
+
+        Checks the cache by URL then by perceptual hash so reposts of an image
+        under a new URL reuse the earlier answer before asking SauceNAO.
+        Concurrent lookups of the same image share one request.
+        Results are cached separately for each set of search options.
+        """
+        guild_settings = await self.settings.guild(guild)
+        options = SearchOptions.from_settings(guild_settings)
+        key = image.key + options.signature
+        self.metrics.incr("lookups")
+        response = await self.sauce_cache.get(key)
+        if response is not None:
+            self.metrics.incr("cache_hits")
+            return response
+        if key in self.inflight:
+            self.metrics.incr("coalesced")
+        upload = guild_settings["lookup_mode"] == "upload"
+        return await self.inflight.do(
+            key, lambda: self._lookup_uncached(image, api_key, guild, options, upload)
+        )
+
+    async def _lookup_uncached(
+        self,
+        image: ImageCandidate,
+        api_key: Optional[str],
+        guild: discord.Guild,
+        options: SearchOptions,
+        upload: bool,
+    ) -> Optional["SauceResponse"]:
+        fingerprint, thumbnail = await self.prepare_image(image.url, upload)
+        if upload and thumbnail is None:
+            self.metrics.incr("upload_fallbacks")
+            log.debug("Could not build an upload thumbnail for %r, using its URL", image.url)
+        if fingerprint is None:
+            return await self._query_sauce(image, api_key, guild, options, None, None)
+        response = await self.sauce_cache.get_similar(fingerprint, options.signature)
+        if response is not None:
+            self.metrics.incr("fingerprint_hits")
+            await self.sauce_cache.set(image.key + options.signature, response)
+            return response
+        return await self.inflight.do(
+            self.sauce_cache.fingerprint_key(fingerprint, options.signature),
+            lambda: self._query_sauce(image, api_key, guild, options, fingerprint, thumbnail),
+        )
+
+    async def _query_sauce(
+        self,
+        image: ImageCandidate,
+        api_key: Optional[str],
+        guild: discord.Guild,
+        options: SearchOptions,
+        fingerprint: Optional[int],
+        thumbnail: Optional[bytes],
+    ) -> Optional["SauceResponse"]:
+        from saucenao_api.errors import LimitReachedError, LongLimitReachedError
+
+        try:
+            with self.metrics.time("quota_wait"):
+                await self.sauce_quota.acquire(guild.id)
+            self.metrics.incr("api_calls")
+            with self.metrics.time("saucenao"):
+                if thumbnail is not None:
+                    response = await self.sauce_api.from_file(thumbnail, api_key, **options.params())
+                else:
+                    response = await self.sauce_api.from_url(image.url, api_key, **options.params())
+        except QuotaExceeded:
+            self.metrics.incr("ratelimit_rejections")
+            return None
+        except LimitReachedError as e:
+            self.metrics.incr("ratelimit_errors")
+            log.warning("SauceNAO quota reached looking up %r: %s", image.url, e)
+            if isinstance(e, LongLimitReachedError):
+                self.sauce_quota.long.empty()
+            self.sauce_quota.short.empty()
+            return None
+        except Exception:
+            self.metrics.incr("errors")
+            log.exception("Error looking up %r on SauceNAO", image.url)
+            return None
+        self.sauce_quota.update(response)
+        await self.sauce_cache.set(image.key + options.signature, response)
+        if fingerprint is not None:
+            await self.sauce_cache.set_fingerprint(fingerprint, response, options.signature)
+        return response
+
+    async def bounded_lookup(
+        self, image: ImageCandidate, api_key: Optional[str], guild: discord.Guild
+    ) -> Optional["SauceResponse"]:
+        """Run `lookup_sauce` under the global concurrency limit"""
+        async with self.lookup_semaphore:
+            return await self.lookup_sauce(image, api_key, guild)
+
+    async def process_job(self, job: SauceJob) -> None:
+        """Pipeline handler running a queued job"""
+        with self.metrics.time("job"):
+            await self.perform_trigger(job.message, job.trigger, job.images)
+
+    async def scan_channel(
+        self,
+        channel: discord.TextChannel,
+        trigger: Trigger,
+        progress: ScanProgress,
+        *,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> AsyncIterator[ScanProgress]:
+        """
+        Look up the images in a channel's history oldest first
+
+        Yields after every message so the caller can report progress and
+        keep its checkpoint. Each message waits until live lookups are done
+        and the quota has room, raising `QuotaExceeded` once the daily
+        limit is spent.
+        """
+        seen: Set[str] = set()
+        history = channel.history(
+            limit=limit,
+            after=discord.Object(after) if after else None,
+            oldest_first=True,
+        )
+        async for message in history:
+            if not message.author.bot and not await self.check_is_command(message):
+                images = [i for i in self.extractor.extract(message) if i.key not in seen]
+                if images:
+                    await self.sauce_quota.wait_idle(len(images))
+                    seen.update(i.key for i in images)
+                    await self.perform_trigger(message, trigger, images)
+                    progress.images += len(images)
+            progress.messages += 1
+            progress.last_id = message.id
+            yield progress
+
+    async def perform_trigger(
+        self,
+        message: discord.Message,
+        trigger: Trigger,
+        images: Optional[List[ImageCandidate]] = None,
+    ) -> None:
 
         guild: discord.Guild = cast(discord.Guild, message.guild)
         channel: discord.TextChannel = cast(discord.TextChannel, message.channel)
         own_permissions = channel.permissions_for(guild.me)
 
         if own_permissions.send_messages:
-            url_re = "https?.*\.(?:jpg|png|jpeg|webp)"
-            urls: list = []
-
-            if message.attachments:
-                for attachment in message.attachments:
-                    urls.append(attachment.url)
-            if re.search(url_re, message.content):
-                for url in re.findall(url_re, message.content):
-                    urls.append(url)
-
-            if urls:
-                saucenao_keys = await self.bot.get_shared_api_tokens("saucenao")
-                sauce = SauceNao(saucenao_keys.get("api_key"))
-                for url in urls:
-                    await channel.trigger_typing()
-                    sauce_link = "?url=".format(SauceNao.SAUCENAO_URL, url)
-                    results = sauce.from_url(url)[0]
-
-                    embed = discord.Embed(title="{} by {} ()".format(results.title, results.author, results.similarity),
+            if images is None:
+                images = self.extractor.extract(message)
+
+            if images:
+                api_key = await self.settings.api_key()
+                guild_settings = await self.settings.guild(guild)
+                await channel.trigger_typing()
+                responses = await asyncio.gather(
+                    *(self.bounded_lookup(image, api_key, guild) for image in images),
+                    return_exceptions=True,
+                )
+                replies = ReplyBatch(channel, message, trigger.delete_after)
+                with self.metrics.time("embed_colour"):
+                    colour = await self.settings.embed_colour(channel)
+                for image, response in zip(images, responses):
+                    if isinstance(response, BaseException):
+                        self.metrics.incr("errors")
+                        log.error("Error looking up %r", image.url, exc_info=response)
+                        continue
+                    if not response:
+                        continue
+                    results = response[0]
+                    if results.similarity < guild_settings["min_similarity"]:
+                        continue
+                    sauce_link = "{}?url={}".format(SauceNaoClient.SAUCENAO_URL, quote(image.url, safe=""))
+
+                    embed = discord.Embed(title="{} by {} ({}%)".format(results.title, results.author, results.similarity),
                                           url=sauce_link,
                                           # description="**[{}]({})**".format(results.title, sauce_link),
-                                          color=await self.bot.get_embed_colour(channel))
-                    embed.set_thumbnail(url=results[0].thumbnail)
+                                          color=colour)
+                    embed.set_thumbnail(url=results.thumbnail)
                     # setattr(embed.thumbnail, "width", 32)
                     # setattr(embed.thumbnail, "height", 32)
 
-                    for x in range(2):
-                        if results.urls[x]:
-                            lnk = results.urls[x]
-                            ext = tldextract.extract(lnk)
-                            embed.add_field(name=ext.subdomain.capitalize(),
-                                            value="[Source]({})".format(lnk),
-                                            inline=False if len(results.urls) == 1 else True)
-
-                    error_msg = "Retrigger encountered an error in %r with trigger %r"
-                    try:
-                        if version_info >= VersionInfo.from_str("3.4.6"):
-                            await channel.send(
-                                embed=embed,
-                                delete_after=trigger.delete_after,
-                                reference=message
-                            )
-                        else:
-                            await channel.send(
-                                embed=embed,
-                                delete_after=trigger.delete_after
-                            )
-                    except discord.errors.Forbidden:
-                        log.debug(error_msg, guild, trigger)
-                    except Exception:
-                        log.exception(error_msg, guild, trigger)
+                    for lnk in results.urls[:2]:
+                        embed.add_field(name=source_label(lnk),
+                                        value="[Source]({})".format(lnk),
+                                        inline=False if len(results.urls) == 1 else True)
+                    replies.add(embed)
+
+                if not replies:
+                    return
+                trigger.count += len(replies)
+                self.triggers.mark(guild.id)
+                error_msg = "PictureSauce encountered an error in %r with trigger %r"
+                try:
+                    with self.metrics.time("send"):
+                        await replies.send()
+                except discord.errors.Forbidden:
+                    log.debug(error_msg, guild, trigger)
+                except Exception:
+                    self.metrics.incr("errors")
+                    log.exception(error_msg, guild, trigger)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
+        await self.check_triggers(message)
+
+    @commands.Cog.listener()
+    async def on_message_edit(self, before: discord.Message, after: discord.Message) -> None:
+        # only messages processed recently, anything else was filtered or is too old
+        if after.id not in self.processed:
+            return
+        await self.check_triggers(after, edit=True)
+
+    async def check_triggers(self, message: discord.Message, edit: bool = False) -> None:
         if message.guild is None:
             return
         if message.author.bot:
@@ -166,42 +430,89 @@ class SauceHandler:
         operations.
         """
         guild: discord.Guild = cast(discord.Guild, message.guild)
-        if guild.id not in self.triggers:
+        index = self.guild_index(guild.id)
+        if not index:
+            return
+        channel: discord.TextChannel = cast(discord.TextChannel, message.channel)
+        triggers = index.for_channel(channel)
+        if not triggers:
             return
-        # channel: discord.TextChannel = cast(discord.TextChannel, message.channel)
         author: Optional[discord.Member] = guild.get_member(message.author.id)
         if not author:
             return
 
         blocked = not await self.bot.allowed_by_whitelist_blacklist(author)
         # channel_perms = channel.permissions_for(author)
-        is_command = await self.check_is_command(message)
+        with self.metrics.time("prefix"):
+            is_command = await self.check_is_command(message)
         # is_mod = await self.is_mod_or_admin(author)
 
-        autoimmune = getattr(self.bot, "is_automod_immune", None)
-        # auto_mod = ["delete", "kick", "ban", "add_role", "remove_role"]
-        for trigger in self.triggers[guild.id]:
-            if not trigger.enabled:
-                continue
-            # if edit and not trigger.check_edits:
-            #     continue
-            # if trigger.chance:
-            #     if random.randint(0, trigger.chance) != 0:
-            #         continue
-
-            allowed_trigger = await self.check_bw_list(trigger, message)
-            # is_auto_mod = trigger.response_type in auto_mod
-            if not allowed_trigger:
-                continue
-            if is_command and not trigger.ignore_commands:
+        images: Optional[List[ImageCandidate]] = None
+        for trigger in triggers:
+            if is_command:
                 continue
             if blocked:
                 log.debug(
-                    "ReTrigger: Channel is ignored or %r is blacklisted %r",
+                    "PictureSauce: Channel is ignored or %r is blacklisted %r",
                     author,
                     trigger,
                 )
                 continue
 
-            await self.perform_trigger(message, trigger)
+            if images is None:
+                with self.metrics.time("extract"):
+                    images = self.extractor.extract(message)
+                if edit:
+                    images = self.processed.added(message.id, images)
+                else:
+                    self.processed.record(message.id, images)
+            if not images:
+                return
+            guild_settings = await self.settings.guild(guild)
+            if guild_settings["reaction_emoji"]:
+                # reaction mode only remembers the images until someone asks for them
+                self.pending.add(guild.id, message.id, images)
+                return
+            # edits only get this far when they add images, which spend quota like a new post
+            if not self.cooldowns.check(trigger, message):
+                self.metrics.incr("cooldown_rejections")
+                log.debug("PictureSauce: %r is on cooldown for %r", trigger, author)
+                continue
+            if not self.pipeline.submit(SauceJob(message, trigger, images, PRIORITY_NORMAL)):
+                self.metrics.incr("dropped_jobs")
+            return
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
+        if payload.guild_id is None:
+            return
+        # most reactions are on messages nobody is waiting on, skip those first
+        if not self.pending.get(payload.guild_id, payload.message_id):
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        member = payload.member
+        if guild is None or member is None or member.bot:
+            return
+        guild_settings = await self.settings.guild(guild)
+        if emoji_key(payload.emoji) != guild_settings["reaction_emoji"]:
+            return
+        channel = guild.get_channel(payload.channel_id)
+        index = self.guild_index(guild.id)
+        triggers = index.for_channel(channel) if index and channel else ()
+        if not triggers:
+            return
+        if not await self.bot.allowed_by_whitelist_blacklist(member):
+            return
+        # another reaction may have claimed the images while we awaited
+        if not self.pending.get(guild.id, payload.message_id):
+            return
+        message = channel.get_partial_message(payload.message_id)
+        # the images stay pending so someone else can ask once the cooldown allows
+        if not self.cooldowns.check(triggers[0], message, member):
+            self.metrics.incr("cooldown_rejections")
+            log.debug("PictureSauce: %r is on cooldown for %r", triggers[0], member)
             return
+        images = self.pending.pop(guild.id, payload.message_id)
+        self.metrics.incr("reaction_lookups")
+        if not self.pipeline.submit(SauceJob(message, triggers[0], list(images), PRIORITY_HIGH)):
+            self.metrics.incr("dropped_jobs")
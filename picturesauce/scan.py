@@ -0,0 +1,69 @@
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .metrics import write_atomic
+
+log = logging.getLogger("red.xangel-cogs.PictureSauce")
+
+
+class ScanProgress:
+    """Running totals for one channel history scan"""
+
+    __slots__ = ("channel_id", "messages", "images", "last_id", "started")
+
+    def __init__(self, channel_id: int, last_id: Optional[int] = None):
+        self.channel_id = channel_id
+        self.messages = 0
+        self.images = 0
+        self.last_id = last_id
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Messages scanned per second"""
+        elapsed = self.elapsed
+        return self.messages / elapsed if elapsed else 0.0
+
+
+class ScanCheckpoints:
+    """
+    Last scanned message ID per channel so long scans can resume
+
+    Stored as JSON in the cog's data folder, read on first use and written
+    with `save`, which does blocking IO and belongs in an executor.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._data: Optional[Dict[str, int]] = None
+
+    @property
+    def data(self) -> Dict[str, int]:
+        if self._data is None:
+            try:
+                self._data = json.loads(self.path.read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                self._data = {}
+            except ValueError:
+                log.warning("Ignoring corrupt scan checkpoints in %s", self.path)
+                self._data = {}
+        return self._data
+
+    def get(self, channel_id: int) -> Optional[int]:
+        return self.data.get(str(channel_id))
+
+    def set(self, channel_id: int, message_id: int) -> None:
+        self.data[str(channel_id)] = message_id
+
+    def clear(self, channel_id: int) -> None:
+        self.data.pop(str(channel_id), None)
+
+    def save(self) -> None:
+        write_atomic(self.path, json.dumps(self.data))
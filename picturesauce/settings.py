@@ -0,0 +1,66 @@
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import discord
+from redbot.core import Config
+from redbot.core.bot import Red
+
+# bot commands which change what get_embed_colour returns
+COLOUR_COMMANDS = ("set colour", "set color", "set usebotcolour", "set usebotcolor")
+
+
+class SettingsCache:
+    """
+    In-memory snapshot of the API key and guild settings
+
+    Values are loaded on first use and kept until they're invalidated by
+    a token update or config change, so the message path doesn't await
+    Config in steady state. Embed colours are also refreshed after `ttl`
+    seconds since role colour changes don't fire a Red event.
+    """
+
+    def __init__(self, bot: Red, config: Config, ttl: float = 600):
+        self.bot = bot
+        self.config = config
+        self.ttl = ttl
+        self._api_key: Optional[str] = None
+        self._api_key_loaded = False
+        self._guilds: Dict[int, Dict[str, Any]] = {}
+        self._colours: Dict[int, Tuple[float, discord.Colour]] = {}
+
+    async def api_key(self) -> Optional[str]:
+        if not self._api_key_loaded:
+            tokens = await self.bot.get_shared_api_tokens("saucenao")
+            self._api_key = tokens.get("api_key")
+            self._api_key_loaded = True
+        return self._api_key
+
+    def update_api_key(self, api_tokens: Mapping[str, str]) -> None:
+        self._api_key = api_tokens.get("api_key")
+        self._api_key_loaded = True
+
+    async def guild(self, guild: discord.Guild) -> Dict[str, Any]:
+        try:
+            return self._guilds[guild.id]
+        except KeyError:
+            pass
+        data = await self.config.guild(guild).all()
+        # triggers are kept in their own store
+        data.pop("trigger_list", None)
+        self._guilds[guild.id] = data
+        return data
+
+    async def embed_colour(self, channel: discord.abc.Messageable) -> discord.Colour:
+        now = time.monotonic()
+        cached = self._colours.get(channel.id)
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1]
+        colour = await self.bot.get_embed_colour(channel)
+        self._colours[channel.id] = (now, colour)
+        return colour
+
+    def invalidate_guild(self, guild_id: int) -> None:
+        self._guilds.pop(guild_id, None)
+
+    def invalidate_colours(self) -> None:
+        self._colours.clear()
@@ -0,0 +1,78 @@
+import functools
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import tldextract
+
+# registered domain -> label shown on result embeds
+SITE_LABELS = {
+    "pixiv.net": "Pixiv",
+    "donmai.us": "Danbooru",
+    "gelbooru.com": "Gelbooru",
+    "yande.re": "Yande.re",
+    "konachan.com": "Konachan",
+    "sankakucomplex.com": "Sankaku",
+    "anime-pictures.net": "Anime-Pictures",
+    "e-shuushuu.net": "E-Shuushuu",
+    "zerochan.net": "Zerochan",
+    "twitter.com": "Twitter",
+    "x.com": "Twitter",
+    "deviantart.com": "DeviantArt",
+    "artstation.com": "ArtStation",
+    "nijie.info": "Nijie",
+    "nicovideo.jp": "Nico Nico Seiga",
+    "fanbox.cc": "Fanbox",
+    "fantia.jp": "Fantia",
+    "skeb.jp": "Skeb",
+    "pawoo.net": "Pawoo",
+    "bcy.net": "Bcy",
+    "medibang.com": "MediBang",
+    "furaffinity.net": "FurAffinity",
+    "e621.net": "e621",
+    "furrynetwork.com": "Furry Network",
+    "mangadex.org": "MangaDex",
+    "mangaupdates.com": "MangaUpdates",
+    "myanimelist.net": "MyAnimeList",
+    "anidb.net": "AniDB",
+    "anilist.co": "AniList",
+    "imdb.com": "IMDb",
+    "getchu.com": "Getchu",
+    "dlsite.com": "DLsite",
+    "fakku.net": "FAKKU",
+    "e-hentai.org": "E-Hentai",
+    "nhentai.net": "nhentai",
+    "2d-market.com": "2D-Market",
+    "drawr.net": "Drawr",
+    "portalgraphics.net": "PortalGraphics",
+    "idol.sankakucomplex.com": "Idol Complex",
+}
+
+_extract: Optional["tldextract.TLDExtract"] = None
+
+
+def _extractor() -> "tldextract.TLDExtract":
+    # no suffix list URLs means tldextract only reads its bundled snapshot
+    global _extract
+    if _extract is None:
+        import tldextract
+
+        _extract = tldextract.TLDExtract(suffix_list_urls=())
+    return _extract
+
+
+@functools.lru_cache(maxsize=2048)
+def site_label(host: str) -> str:
+    """Human readable name for a site from its hostname"""
+    host = host.lower().rstrip(".")
+    if host in SITE_LABELS:
+        return SITE_LABELS[host]
+    ext = _extractor()(host)
+    if not ext.suffix:
+        return ext.domain.capitalize() or host
+    domain = "{}.{}".format(ext.domain, ext.suffix)
+    return SITE_LABELS.get(domain, ext.domain.capitalize())
+
+
+def source_label(url: str) -> str:
+    return site_label(urlsplit(url).hostname or "")
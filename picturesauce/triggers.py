@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import discord
+from redbot.core import Config
+
+from .converters import Trigger
+
+log = logging.getLogger("red.xangel-cogs.PictureSauce")
+
+
+class TriggerIndex:
+    """
+    Maps channel and category IDs to the enabled triggers that apply there
+
+    Built whenever a guild's triggers load or change so `on_message` can
+    find the eligible triggers for a channel without scanning every one.
+    """
+
+    __slots__ = ("_targets", "_channels")
+
+    def __init__(self, triggers: Iterable[Trigger] = ()):
+        self._targets: Dict[int, List[Trigger]] = {}
+        # resolved (channel, category) lookups, reset with the index
+        self._channels: Dict[Tuple[int, Optional[int]], Tuple[Trigger, ...]] = {}
+        for trigger in triggers:
+            if not trigger.enabled:
+                continue
+            for target in trigger.setlist:
+                self._targets.setdefault(target, []).append(trigger)
+
+    def __bool__(self) -> bool:
+        return bool(self._targets)
+
+    def for_channel(self, channel: discord.abc.GuildChannel) -> Tuple[Trigger, ...]:
+        """Return the enabled triggers whose setlist covers this channel"""
+        key = (channel.id, getattr(channel, "category_id", None))
+        try:
+            return self._channels[key]
+        except KeyError:
+            pass
+        found = list(self._targets.get(key[0], ()))
+        if key[1] is not None:
+            for trigger in self._targets.get(key[1], ()):
+                if trigger not in found:
+                    found.append(trigger)
+        result = self._channels[key] = tuple(found)
+        return result
+
+
+class TriggerStore(Dict[int, List[Trigger]]):
+    """
+    In-memory guild triggers with write-behind persistence
+
+    Counter increments only mark their guild as dirty, `flush` later writes
+    just those guilds to Config in batches. Setting changes go through
+    `save` so they are in Config before a reload reads it back.
+    Guilds queued with `load` keep their raw Config data until something
+    first looks them up, so startup doesn't build triggers for every guild.
+    `on_hydrate` is called with the guild ID whenever that happens.
+    """
+
+    def __init__(self, *args, on_hydrate: Optional[Callable[[int], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty: Set[int] = set()
+        self.pending: Dict[int, dict] = {}
+        self.on_hydrate = on_hydrate
+
+    def load(self, all_guilds: Dict[int, dict]) -> int:
+        """Queue the output of `Config.all_guilds()`, returns how many guilds have triggers"""
+        for guild_id, data in all_guilds.items():
+            trigger_list = data.get("trigger_list")
+            if trigger_list:
+                self.pending[guild_id] = trigger_list
+        return len(self.pending)
+
+    def __missing__(self, guild_id: int) -> List[Trigger]:
+        raw = self.pending.pop(guild_id)
+        triggers = self[guild_id] = [Trigger.from_json(t) for t in raw.values()]
+        if self.on_hydrate is not None:
+            self.on_hydrate(guild_id)
+        return triggers
+
+    def __contains__(self, guild_id: object) -> bool:
+        return super().__contains__(guild_id) or guild_id in self.pending
+
+    def get(self, guild_id: int, default: Optional[List[Trigger]] = None) -> Optional[List[Trigger]]:
+        try:
+            return self[guild_id]
+        except KeyError:
+            return default
+
+    def setdefault(self, guild_id: int, default: Optional[List[Trigger]] = None) -> List[Trigger]:
+        try:
+            return self[guild_id]
+        except KeyError:
+            self[guild_id] = default
+            return default
+
+    def mark(self, guild_id: int) -> None:
+        self.dirty.add(guild_id)
+
+    async def save(self, config: Config, guild_id: int) -> None:
+        """Write one guild's triggers to Config now"""
+        self.dirty.discard(guild_id)
+        try:
+            await self._save_guild(config, guild_id)
+        except Exception:
+            self.dirty.add(guild_id)
+            raise
+
+    async def flush(self, config: Config, batch_size: int = 25) -> int:
+        """Write every dirty guild's triggers to Config, returns how many were saved"""
+        dirty, self.dirty = self.dirty, set()
+        pending = list(dirty)
+        saved = 0
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start : start + batch_size]
+            results = await asyncio.gather(
+                *(self._save_guild(config, guild_id) for guild_id in batch),
+                return_exceptions=True,
+            )
+            for guild_id, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    log.error("Error saving triggers for guild %s", guild_id, exc_info=result)
+                    # try again on the next flush
+                    self.dirty.add(guild_id)
+                else:
+                    saved += 1
+        return saved
+
+    async def _save_guild(self, config: Config, guild_id: int) -> None:
+        triggers = self.get(guild_id)
+        group = config.guild_from_id(guild_id)
+        if not triggers:
+            await group.trigger_list.clear()
+            return
+        await group.trigger_list.set(
+            {str(t.created_at): t.to_json() for t in triggers}
+        )
@@ -0,0 +1,63 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Literal, Optional, TypeVar
+
+log = logging.getLogger("red.xangel-cogs.PictureSauce")
+
+T = TypeVar("T")
+Backend = Literal["thread", "process"]
+
+
+class WorkerPool:
+    """
+    Lazily started executor for CPU bound work like image hashing
+
+    Nothing is spawned until the first job arrives. Functions sent to the
+    process backend must be picklable module level functions.
+    """
+
+    def __init__(self, max_workers: int = 2, backend: Backend = "thread"):
+        self.max_workers = max_workers
+        self.backend = backend
+        self._executor: Optional[Executor] = None
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.backend == "process":
+                # imports multiprocessing, so only when the process backend is used
+                from concurrent.futures import ProcessPoolExecutor
+
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="picturesauce"
+                )
+            log.debug("Started %s %s workers", self.max_workers, self.backend)
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run `func` in the pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        if kwargs:
+            func = functools.partial(func, **kwargs)
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def configure(self, max_workers: int, backend: Backend) -> None:
+        """Change the pool size or backend, the old pool finishes its current jobs"""
+        if max_workers == self.max_workers and backend == self.backend:
+            return
+        self.max_workers = max_workers
+        self.backend = backend
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+from picturesauce import cooldowns
+from picturesauce.converters import Trigger
+from picturesauce.cooldowns import CooldownTracker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cooldowns, "time", clock)
+    return clock
+
+
+def message(author=1, channel=10, guild=100):
+    return SimpleNamespace(
+        author=SimpleNamespace(id=author),
+        channel=SimpleNamespace(id=channel),
+        guild=SimpleNamespace(id=guild),
+    )
+
+
+def test_no_cooldown_always_passes(clock):
+    tracker = CooldownTracker()
+    trigger = Trigger(1, created_at=1)
+    assert tracker.check(trigger, message())
+    assert tracker.check(trigger, message())
+    assert len(tracker) == 0
+
+
+def test_user_scope(clock):
+    tracker = CooldownTracker()
+    trigger = Trigger(1, cooldown={"user": 30}, created_at=1)
+    assert tracker.check(trigger, message(author=1))
+    assert not tracker.check(trigger, message(author=1))
+    assert tracker.check(trigger, message(author=2))
+    # a reacting member stands in for the author
+    assert tracker.check(trigger, message(author=1), SimpleNamespace(id=3))
+    clock.now += 30
+    assert tracker.check(trigger, message(author=1))
+
+
+def test_rejected_checks_start_no_windows(clock):
+    tracker = CooldownTracker()
+    trigger = Trigger(1, cooldown={"user": 10, "channel": 60}, created_at=1)
+    assert tracker.check(trigger, message(author=1))
+    assert not tracker.check(trigger, message(author=2))
+    clock.now += 60
+    # user 2 was rejected by the channel window so has no window of its own
+    assert tracker.check(trigger, message(author=2))
+
+
+def test_expired_entries_are_pruned(clock):
+    tracker = CooldownTracker()
+    trigger = Trigger(1, cooldown={"user": 5}, created_at=1)
+    for author in range(50):
+        tracker.check(trigger, message(author=author))
+    assert len(tracker) == 50
+    clock.now += 5
+    tracker.check(trigger, message(author=1000))
+    assert len(tracker) == 1
+    assert len(tracker._heap) == 1
+
+
+def test_max_entries_caps_memory(clock):
+    tracker = CooldownTracker(max_entries=10)
+    trigger = Trigger(1, cooldown={"user": 60}, created_at=1)
+    for author in range(100):
+        clock.now += 0.01
+        tracker.check(trigger, message(author=author))
+    assert len(tracker) <= 11
+    assert len(tracker._heap) <= 11
+
+
+def test_reset_forgets_only_that_trigger(clock):
+    tracker = CooldownTracker()
+    first = Trigger(1, cooldown={"user": 60}, created_at=1)
+    second = Trigger(1, cooldown={"user": 60}, created_at=2)
+    tracker.check(first, message())
+    tracker.check(second, message())
+    tracker.reset(first)
+    assert tracker.check(first, message())
+    assert not tracker.check(second, message())
@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+
+import discord
+
+from picturesauce.extractor import ImageExtractor, normalize_url
+
+CDN = "https://cdn.discordapp.com/attachments/1/2/cat.png"
+
+
+class Message(discord.Message):
+    def __init__(self, content="", attachments=(), embeds=(), reference=None):
+        self.content = content
+        self.attachments = list(attachments)
+        self.embeds = list(embeds)
+        self.reference = reference
+
+
+def attachment(url, content_type="image/png", size=1000, width=512, height=512):
+    return SimpleNamespace(
+        url=url, content_type=content_type, size=size, width=width, height=height
+    )
+
+
+def embed(kind, image=None, thumbnail=None, url=None, width=None, height=None):
+    return SimpleNamespace(
+        type=kind,
+        url=url,
+        image=SimpleNamespace(url=image, width=width, height=height),
+        thumbnail=SimpleNamespace(url=thumbnail, width=width, height=height),
+    )
+
+
+def urls(message, **kwargs):
+    return [c.url for c in ImageExtractor(**kwargs).extract(message)]
+
+
+def test_normalize_url_strips_cdn_signatures():
+    signed = "https://Media.DiscordApp.net/attachments/1/2/cat.png?ex=65&is=64&hm=abc&width=400#top"
+    assert normalize_url(signed) == CDN
+    assert normalize_url(CDN + "?ex=1&hm=2") == normalize_url(CDN + "?ex=3&hm=4")
+
+
+def test_normalize_url_keeps_other_queries():
+    url = "https://Example.com/image?id=5&format=png#frag"
+    assert normalize_url(url) == "https://example.com/image?id=5&format=png"
+
+
+def test_adjacent_links_are_split():
+    content = "look https://a.com/1.png, https://b.com/2.jpg! and <https://c.com/3.webp>|https://d.com/4.jpeg"
+    assert urls(Message(content)) == [
+        "https://a.com/1.png",
+        "https://b.com/2.jpg",
+        "https://c.com/3.webp",
+        "https://d.com/4.jpeg",
+    ]
+
+
+def test_query_string_and_format_links():
+    content = (
+        CDN + "?ex=65&is=64&hm=abc "
+        "https://pbs.twimg.com/media/abc?format=jpg&name=large "
+        "https://example.com/page?img=cat.png "
+        "https://example.com/notes.txt"
+    )
+    assert urls(Message(content)) == [
+        CDN + "?ex=65&is=64&hm=abc",
+        "https://pbs.twimg.com/media/abc?format=jpg&name=large",
+    ]
+
+
+def test_resigned_cdn_links_are_deduplicated():
+    message = Message(
+        CDN + "?ex=1&hm=2 " + CDN.replace("cdn.discordapp.com", "media.discordapp.net") + "?ex=3&width=100",
+        attachments=[attachment(CDN + "?ex=9&hm=9")],
+    )
+    found = ImageExtractor().extract(message)
+    assert [c.source for c in found] == ["attachment"]
+    assert found[0].key == CDN
+
+
+def test_attachments_are_filtered():
+    message = Message(
+        attachments=[
+            attachment("https://a.com/1.png"),
+            attachment("https://a.com/2.mp4", content_type="video/mp4"),
+            attachment("https://a.com/3.png", size=30 * 1024 * 1024),
+            attachment("https://a.com/4.png", width=16, height=16),
+            attachment("https://a.com/5.jpg", content_type=None),
+        ]
+    )
+    assert urls(message) == ["https://a.com/1.png", "https://a.com/5.jpg"]
+
+
+def test_embeds():
+    message = Message(
+        embeds=[
+            embed("image", thumbnail="https://a.com/1.png", url="https://a.com/page"),
+            embed("rich", image="https://a.com/2.png"),
+            embed("article", image="https://a.com/3.png", width=8, height=8),
+            embed("video", thumbnail="https://a.com/4.png"),
+            embed("rich"),
+        ]
+    )
+    found = ImageExtractor().extract(message)
+    assert [(c.url, c.source) for c in found] == [
+        ("https://a.com/1.png", "embed"),
+        ("https://a.com/2.png", "embed"),
+    ]
+
+
+def test_replies_are_included_once():
+    original = Message("https://a.com/1.png https://a.com/2.png")
+    reply = Message(
+        "https://a.com/1.png", reference=SimpleNamespace(resolved=original)
+    )
+    found = ImageExtractor().extract(reply)
+    assert [(c.url, c.source) for c in found] == [
+        ("https://a.com/1.png", "content"),
+        ("https://a.com/2.png", "reply_content"),
+    ]
+    assert urls(reply, include_replies=False) == ["https://a.com/1.png"]
+    # deleted replies resolve to something other than a message
+    gone = Message("", reference=SimpleNamespace(resolved=None))
+    assert urls(gone) == []
+
+
+def test_max_images():
+    content = " ".join("https://a.com/{}.png".format(n) for n in range(5))
+    assert len(urls(Message(content), max_images=3)) == 3
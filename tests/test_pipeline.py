@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+from picturesauce.pipeline import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    SauceJob,
+    SaucePipeline,
+)
+
+
+def job(number, priority):
+    return SauceJob(SimpleNamespace(id=number), None, [], priority)
+
+
+async def noop(job):
+    pass
+
+
+def test_drop_lowest_evicts_newest_lower_priority_job():
+    async def scenario():
+        pipeline = SaucePipeline(noop, workers=1, maxsize=2)
+        assert pipeline.submit(job(1, PRIORITY_LOW))
+        assert pipeline.submit(job(2, PRIORITY_LOW))
+        assert pipeline.submit(job(3, PRIORITY_NORMAL))
+        assert pipeline.dropped == 1
+        assert len(pipeline) == 2
+        # nothing of lower priority left to evict
+        assert not pipeline.submit(job(4, PRIORITY_LOW))
+        assert pipeline.dropped == 2
+        assert [j.message.id for j in pipeline._queues[PRIORITY_LOW]] == [1]
+        assert pipeline.submit(job(5, PRIORITY_HIGH))
+        assert pipeline.submit(job(6, PRIORITY_HIGH))
+        assert not pipeline.submit(job(7, PRIORITY_HIGH))
+        assert pipeline.dropped == 5
+        assert [j.message.id for j in pipeline._queues[PRIORITY_HIGH]] == [5, 6]
+        assert len(pipeline) == 2
+
+    asyncio.run(scenario())
+
+
+def test_drop_new_rejects_when_full():
+    async def scenario():
+        pipeline = SaucePipeline(noop, workers=1, maxsize=1, overflow="drop_new")
+        assert pipeline.submit(job(1, PRIORITY_LOW))
+        assert not pipeline.submit(job(2, PRIORITY_HIGH))
+        assert pipeline.dropped == 1
+        assert len(pipeline) == 1
+
+    asyncio.run(scenario())
+
+
+def test_jobs_run_by_priority_and_survive_errors():
+    async def scenario():
+        ran = []
+
+        async def handler(job):
+            ran.append(job.message.id)
+            if job.message.id == 2:
+                raise ValueError("lookup failed")
+
+        pipeline = SaucePipeline(handler, workers=1, maxsize=10)
+        pipeline.submit(job(1, PRIORITY_LOW))
+        pipeline.submit(job(2, PRIORITY_NORMAL))
+        pipeline.submit(job(3, PRIORITY_HIGH))
+        pipeline.submit(job(4, PRIORITY_NORMAL))
+        pipeline.start()
+        await pipeline.drain(timeout=1)
+        assert not pipeline.submit(job(5, PRIORITY_HIGH))
+        return ran
+
+    assert asyncio.run(scenario()) == [3, 2, 4, 1]
+
+
+def test_evicted_jobs_dont_leave_stray_wakeups():
+    async def scenario():
+        ran = []
+
+        async def handler(job):
+            ran.append(job.message.id)
+
+        pipeline = SaucePipeline(handler, workers=2, maxsize=1)
+        pipeline.submit(job(1, PRIORITY_LOW))
+        pipeline.submit(job(2, PRIORITY_HIGH))
+        pipeline.start()
+        await pipeline.drain(timeout=1)
+        return ran, pipeline.active, len(pipeline)
+
+    assert asyncio.run(scenario()) == ([2], 0, 0)
@@ -0,0 +1,33 @@
+from picturesauce.prefixes import PrefixMatcher
+
+
+def test_command_name_follows_a_prefix():
+    matcher = PrefixMatcher(["!", "?"])
+    assert matcher.command_name("!sauce set #art") == "sauce"
+    assert matcher.command_name("?help") == "help"
+
+
+def test_longest_prefix_wins():
+    matcher = PrefixMatcher(["!", "!!", ""])
+    assert matcher.command_name("!!sauce") == "sauce"
+    assert matcher.command_name("!sauce") == "sauce"
+
+
+def test_prefix_must_start_the_message():
+    matcher = PrefixMatcher(["!"])
+    assert matcher.command_name("nice pic !sauce") is None
+    assert matcher.command_name(" !sauce") is None
+    assert matcher.command_name("!") is None
+    assert matcher.command_name("! sauce") is None
+
+
+def test_prefixes_are_matched_literally():
+    matcher = PrefixMatcher([".", "$"])
+    assert matcher.command_name("xsauce") is None
+    assert matcher.command_name(".sauce") == "sauce"
+    assert matcher.command_name("$sauce") == "sauce"
+
+
+def test_no_prefixes():
+    assert PrefixMatcher([]).command_name("!sauce") is None
+    assert PrefixMatcher([""]).command_name("sauce") is None
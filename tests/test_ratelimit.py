@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from picturesauce.ratelimit import QuotaExceeded, QuotaScheduler, TokenBucket
+
+
+def test_token_bucket_refills_evenly():
+    bucket = TokenBucket(4, 30)
+    now = bucket.updated
+    for _ in range(4):
+        assert bucket.wait_time(now) == 0
+        bucket.take(now)
+    assert bucket.wait_time(now) == pytest.approx(7.5)
+    assert bucket.wait_time(now + 15) == 0
+    assert bucket.wait_time(now + 15, tokens=4) == pytest.approx(15)
+
+
+def test_token_bucket_sync_never_adds_tokens():
+    bucket = TokenBucket(4, 30)
+    bucket.sync(1, 6)
+    assert bucket.capacity == 6
+    assert bucket.tokens == pytest.approx(1, abs=0.01)
+    bucket.sync(-1)
+    assert bucket.tokens < 0.01
+
+
+def test_guilds_are_released_round_robin():
+    async def scenario():
+        scheduler = QuotaScheduler()
+        scheduler.short = TokenBucket(1, 0.02)
+        scheduler.short.tokens = 0
+        order = []
+
+        async def lookup(guild_id, number):
+            await scheduler.acquire(guild_id)
+            order.append((guild_id, number))
+
+        tasks = [asyncio.create_task(lookup(1, n)) for n in range(3)]
+        tasks += [asyncio.create_task(lookup(2, 0)), asyncio.create_task(lookup(3, 0))]
+        await asyncio.gather(*tasks)
+        scheduler.close()
+        return order
+
+    order = asyncio.run(scenario())
+    assert order == [(1, 0), (2, 0), (3, 0), (1, 1), (1, 2)]
+
+
+def test_full_guild_queue_is_rejected():
+    async def scenario():
+        scheduler = QuotaScheduler(max_queue=2)
+        scheduler.short.empty()
+        waiting = [asyncio.create_task(scheduler.acquire(1)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(QuotaExceeded):
+            await scheduler.acquire(1)
+        # other guilds still have room
+        other = asyncio.create_task(scheduler.acquire(2))
+        await asyncio.sleep(0)
+        assert len(scheduler) == 3
+        scheduler.close()
+        await asyncio.gather(*waiting, other, return_exceptions=True)
+        return scheduler.rejected
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_lookups_time_out_after_max_wait():
+    async def scenario():
+        scheduler = QuotaScheduler(max_wait=0.05)
+        scheduler.short.empty()
+        with pytest.raises(QuotaExceeded):
+            await scheduler.acquire(1)
+        scheduler.close()
+        return scheduler.rejected
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_daily_limit_rejects_immediately():
+    async def scenario():
+        scheduler = QuotaScheduler(max_wait=60)
+        scheduler.long.empty()
+        with pytest.raises(QuotaExceeded):
+            await asyncio.wait_for(scheduler.acquire(1), timeout=1)
+        with pytest.raises(QuotaExceeded):
+            await asyncio.wait_for(scheduler.wait_idle(), timeout=1)
+        assert len(scheduler) == 0
+        scheduler.close()
+
+    asyncio.run(scenario())
+
+
+def test_wait_idle_waits_for_queued_lookups():
+    async def scenario():
+        scheduler = QuotaScheduler()
+        scheduler.short = TokenBucket(2, 0.1)
+        await asyncio.wait_for(scheduler.wait_idle(2), timeout=1)
+        scheduler.short.empty()
+        live = asyncio.create_task(scheduler.acquire(1))
+        idle = asyncio.create_task(scheduler.wait_idle(1, poll=0.01))
+        await live
+        assert not idle.done()
+        await asyncio.wait_for(idle, timeout=1)
+        scheduler.close()
+
+    asyncio.run(scenario())
+
+
+def test_update_adopts_reported_quota():
+    scheduler = QuotaScheduler()
+    response = SimpleNamespace(
+        short_remaining=1, short_limit="6", long_remaining=50, long_limit="200"
+    )
+    scheduler.update(response)
+    assert scheduler.short.capacity == 6
+    assert scheduler.short.tokens == pytest.approx(1, abs=0.01)
+    assert scheduler.long.capacity == 200
+    assert scheduler.long.tokens == pytest.approx(50, abs=0.01)
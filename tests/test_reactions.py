@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from picturesauce.extractor import ImageCandidate
+from picturesauce.reactions import PendingImages, emoji_key
+
+
+def image(key):
+    return ImageCandidate(key, key, "attachment", None, None, None)
+
+
+def test_emoji_key_matches_converter_and_payload():
+    # ValidEmoji strips the brackets from custom emoji
+    assert emoji_key(":sauce:1234") == "1234"
+    assert emoji_key("a:sauce:1234") == "1234"
+    assert emoji_key("<:sauce:1234>") == "1234"
+    assert emoji_key(SimpleNamespace(id=1234, name="sauce")) == "1234"
+    assert emoji_key("\N{LEFT-POINTING MAGNIFYING GLASS}") == "\N{LEFT-POINTING MAGNIFYING GLASS}"
+    unicode_payload = SimpleNamespace(id=None, name="\N{LEFT-POINTING MAGNIFYING GLASS}")
+    assert emoji_key(unicode_payload) == "\N{LEFT-POINTING MAGNIFYING GLASS}"
+
+
+def test_pending_merges_and_evicts_per_guild():
+    pending = PendingImages(max_per_guild=2)
+    pending.add(1, 10, [image("a")])
+    pending.add(1, 10, [image("a"), image("b")])
+    assert [i.key for i in pending.get(1, 10)] == ["a", "b"]
+    pending.add(2, 20, [image("c")])
+    pending.add(1, 11, [image("d")])
+    pending.add(1, 12, [image("e")])
+    assert pending.get(1, 10) is None
+    assert pending.get(2, 20) is not None
+    assert len(pending) == 3
+
+
+def test_pending_pop_only_once():
+    pending = PendingImages()
+    pending.add(1, 10, [image("a")])
+    assert pending.pop(1, 10)
+    assert pending.pop(1, 10) is None
+    assert len(pending) == 0
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from picturesauce.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(3)))
+        assert "key" not in flight
+        again = await flight.do("key", work)
+        return results, again
+
+    assert asyncio.run(scenario()) == ([1, 1, 1], 2)
+
+
+def test_errors_reach_every_waiter_and_release_the_key():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fail():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(flight.do("key", fail) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(flight) == 0
+        with pytest.raises(ValueError):
+            await flight.do("key", fail)
+        return calls
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_cancelling_one_waiter_keeps_the_shared_work():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.02)
+            return "sauce"
+
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await started.wait()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "sauce"
+
+
+def test_cancel_all():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(10)
+
+        waiter = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        flight.cancel_all()
+        assert len(flight) == 0
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
@@ -0,0 +1,114 @@
+import asyncio
+
+from picturesauce.converters import Trigger
+from picturesauce.saucehandler import SauceHandler
+from picturesauce.triggers import TriggerIndex, TriggerStore
+
+
+class Channel:
+    def __init__(self, channel_id, category_id=None):
+        self.id = channel_id
+        self.category_id = category_id
+
+
+class Value:
+    def __init__(self, saved, guild_id):
+        self.saved = saved
+        self.guild_id = guild_id
+
+    async def set(self, value):
+        self.saved[self.guild_id] = value
+
+    async def clear(self):
+        self.saved.pop(self.guild_id, None)
+
+
+class Group:
+    def __init__(self, saved, guild_id):
+        self.trigger_list = Value(saved, guild_id)
+
+
+class Config:
+    def __init__(self):
+        self.saved = {}
+
+    def guild_from_id(self, guild_id):
+        return Group(self.saved, guild_id)
+
+
+def make_handler(all_guilds):
+    handler = SauceHandler()
+    handler.trigger_index = {}
+    handler.triggers = TriggerStore(on_hydrate=handler.reindex_triggers)
+    handler.triggers.load(all_guilds)
+    return handler
+
+
+def saved(*channel_ids, enabled=True, created_at=1):
+    trigger = Trigger(1, setlist=channel_ids, enabled=enabled, created_at=created_at)
+    return {str(created_at): trigger.to_json()}
+
+
+def test_trigger_json_round_trip():
+    trigger = Trigger(5, setlist=[1, 2], cooldown={"user": 30}, created_at=9, delete_after=60)
+    loaded = Trigger.from_json(trigger.to_json())
+    assert loaded.to_json() == trigger.to_json()
+    assert loaded.setlist == frozenset({1, 2})
+
+
+def test_load_is_lazy():
+    handler = make_handler({1: {"trigger_list": saved(10)}, 2: {"trigger_list": {}}})
+    assert 1 in handler.triggers
+    assert 2 not in handler.triggers
+    assert dict.__len__(handler.triggers) == 0
+    assert handler.trigger_index == {}
+
+
+def test_first_message_builds_index():
+    handler = make_handler({1: {"trigger_list": saved(10)}})
+    index = handler.guild_index(1)
+    assert index
+    assert [t.created_at for t in index.for_channel(Channel(10))] == [1]
+    assert not handler.triggers.pending
+
+
+def test_hydrated_by_command_then_message():
+    handler = make_handler({1: {"trigger_list": saved(10)}})
+    # commands such as [p]sauce cooldown read the store directly
+    handler.triggers.get(1)[0].cooldown["user"] = 30
+    assert not handler.triggers.pending
+    index = handler.guild_index(1)
+    assert index
+    assert index.for_channel(Channel(10))[0].cooldown == {"user": 30}
+
+
+def test_unknown_guild():
+    handler = make_handler({})
+    assert handler.guild_index(1) is None
+    assert handler.triggers.get(1) is None
+
+
+def test_index_matches_categories_and_skips_disabled():
+    triggers = [
+        Trigger(1, setlist=[10], created_at=1),
+        Trigger(1, setlist=[20], created_at=2),
+        Trigger(1, setlist=[10], enabled=False, created_at=3),
+    ]
+    index = TriggerIndex(triggers)
+    found = index.for_channel(Channel(10, category_id=20))
+    assert [t.created_at for t in found] == [1, 2]
+    assert index.for_channel(Channel(30)) == ()
+
+
+def test_save_writes_through_and_flush_skips_it():
+    config = Config()
+    store = TriggerStore({1: [Trigger(1, setlist=[10], created_at=1)], 2: []})
+    store.mark(1)
+    store.mark(2)
+    asyncio.run(store.save(config, 1))
+    assert list(config.saved[1]) == ["1"]
+    assert store.dirty == {2}
+    config.saved[2] = saved(20)
+    assert asyncio.run(store.flush(config)) == 1
+    assert 2 not in config.saved
+    assert not store.dirty